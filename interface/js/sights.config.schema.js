@@ -1361,6 +1361,151 @@ const schema = {
                             }
                         }
                     },
+                    {
+                        "type": "object",
+                        "title": "Telemetry Replay",
+                        "options": {
+                            "collapsed": true
+                        },
+                        "properties": {
+                            "enabled": {
+                                "type": "boolean",
+                                "title": "Enable Sensor",
+                                "description": "Whether the telemetry replay sensor is enabled",
+                                "format": "checkbox",
+                                "default": true
+                            },
+                            "type": {
+                                "type": "string",
+                                "title": "Type",
+                                "enum": [
+                                    "replay"
+                                ],
+                                "default": "replay",
+                                "format": "radio"
+                            },
+                            "name": {
+                                "type": "string",
+                                "title": "Replay Sensor Name",
+                                "description": "The pretty name for the telemetry replay sensor.",
+                                "default": "New Replay Sensor"
+                            },
+                            "period": {
+                                "type": "number",
+                                "title": "Update Period",
+                                "description": "How often, in seconds, the recorded data is sampled.",
+                                "default": 1
+                            },
+                            "directory": {
+                                "type": "string",
+                                "title": "Recording Directory",
+                                "description": "The directory of recorded telemetry to play back.",
+                                "default": "telemetry"
+                            },
+                            "source": {
+                                "type": "string",
+                                "title": "Source Sensor",
+                                "description": "The UID of the recorded sensor to play back (e.g. cpu_temp_1). If left empty, each replay sensor plays back a different recorded sensor.",
+                                "required": false
+                            },
+                            "speed": {
+                                "type": "number",
+                                "title": "Playback Speed",
+                                "description": "How fast to play back the recording, e.g. 2 plays back at twice real time.",
+                                "default": 1
+                            },
+                            "loop": {
+                                "type": "boolean",
+                                "title": "Loop",
+                                "description": "Start again from the beginning once the recording ends.",
+                                "format": "checkbox",
+                                "default": true
+                            },
+                            "count": {
+                                "type": "integer",
+                                "title": "Count",
+                                "description": "The number of replay sensors to create from this entry, e.g. for load testing.",
+                                "default": 1
+                            },
+                            "display_on": {
+                                "type": "array",
+                                "title": "Display On",
+                                "description": "A list of graph UIDs to display this sensor's data on.",
+                                "items": {
+                                    "type": "string",
+                                    "title": "Graph UID"
+                                }
+                            }
+                        }
+                    },
+                    {
+                        "type": "object",
+                        "title": "Random Array (Testing)",
+                        "options": {
+                            "collapsed": true
+                        },
+                        "properties": {
+                            "enabled": {
+                                "type": "boolean",
+                                "title": "Enable Sensor",
+                                "description": "Whether the random array sensor is enabled",
+                                "format": "checkbox",
+                                "default": true
+                            },
+                            "type": {
+                                "type": "string",
+                                "title": "Type",
+                                "enum": [
+                                    "random_array"
+                                ],
+                                "default": "random_array",
+                                "format": "radio"
+                            },
+                            "name": {
+                                "type": "string",
+                                "title": "Random Array Sensor Name",
+                                "description": "The pretty name for the random array sensor.",
+                                "default": "Random Array"
+                            },
+                            "period": {
+                                "type": "number",
+                                "title": "Update Period",
+                                "description": "How often, in seconds, a new array is generated.",
+                                "default": 0.1
+                            },
+                            "width": {
+                                "type": "integer",
+                                "title": "Width",
+                                "description": "The number of columns in the array.",
+                                "default": 8
+                            },
+                            "height": {
+                                "type": "integer",
+                                "title": "Height",
+                                "description": "The number of rows in the array.",
+                                "default": 8
+                            },
+                            "min": {
+                                "type": "number",
+                                "title": "Minimum Value",
+                                "default": 20
+                            },
+                            "max": {
+                                "type": "number",
+                                "title": "Maximum Value",
+                                "default": 30
+                            },
+                            "display_on": {
+                                "type": "array",
+                                "title": "Display On",
+                                "description": "A list of graph UIDs to display this sensor's data on, e.g. a thermal camera graph.",
+                                "items": {
+                                    "type": "string",
+                                    "title": "Graph UID"
+                                }
+                            }
+                        }
+                    },
                     {
                         "type": "object",
                         "title": "MultiRandom (Random, Random, Random)",
@@ -302,6 +302,8 @@ $(document).on("ready", function () {
 	createFunctionKeyBind(['h'], "HOME");
 	createFunctionKeyBind(['m'], "MAPPING");
 	createFunctionKeyBind(['r'], "RUNNING");
+	createFunctionKeyBind(['x'], "ARM_STOP");
+	createFunctionKeyBind(['space'], "EMERGENCY_STOP");
 	
 	// Disable keyboard controls when modal is open
 	$(".modal").on('shown.bs.modal', function () {
@@ -13,6 +13,19 @@ var sensorsReady = false;
 
 var global_config;
 
+// Sensor uid for each integer sensor ID, used to decode binary sensor messages
+var sensorIds = {};
+// Binary messages may need decompressing, which happens asynchronously. This keeps them in order.
+var sensorDecodeQueue = Promise.resolve();
+// Ask for compressed binary messages if the browser can decompress them, then uncompressed binary, then JSON
+var sensorProtocols = ("DecompressionStream" in window) ?
+	["sights.bin.v1.deflate", "sights.bin.v1"] : ["sights.bin.v1"];
+// Element types of array sensor values in binary messages, in the same order as DTYPES in sensor_codec.py
+const SENSOR_ARRAY_TYPES = [Int8Array, Uint8Array, Int16Array, Uint16Array, Int32Array, Uint32Array,
+	BigInt64Array, BigUint64Array, Float32Array, Float64Array];
+// How many past samples of each sensor to fill the graphs with after connecting (the length of a line graph)
+const HISTORY_SAMPLES = 11;
+
 function updateCameras() {
 	['front', 'left', 'right', 'back'].forEach(function (e) {
 		// Get parent div of camera stream image
@@ -102,12 +115,120 @@ function updateGraphs(sensor_uid, sensor_data, initial=false) {
 	}
 }
 
+// Decode one tagged value from a binary sensor message. Returns the value and the offset after it.
+function decodeSensorValue(view, offset) {
+	let tag = view.getUint8(offset);
+	offset += 1;
+	switch (tag) {
+		case 0: // Null
+			return [null, offset];
+		case 1: // 32-bit integer
+			return [view.getInt32(offset, true), offset + 4];
+		case 2: // 64-bit float
+			return [view.getFloat64(offset, true), offset + 8];
+		case 3: { // Multi-sensor
+			let count = view.getUint8(offset);
+			offset += 1;
+			let value = {};
+			for (let i = 0; i < count; i++) {
+				let length = view.getUint8(offset);
+				offset += 1;
+				let key = new TextDecoder().decode(new Uint8Array(view.buffer, view.byteOffset + offset, length));
+				offset += length;
+				[value[key], offset] = decodeSensorValue(view, offset);
+			}
+			return [value, offset];
+		}
+		case 4: { // Array
+			let type = SENSOR_ARRAY_TYPES[view.getUint8(offset)];
+			let length = view.getUint32(offset + 1, true);
+			offset += 5;
+			let bytes = length * type.BYTES_PER_ELEMENT;
+			// Copy the elements out, since typed arrays have to be aligned to their element size
+			let value = new type(view.buffer.slice(view.byteOffset + offset, view.byteOffset + offset + bytes));
+			// 64-bit integers are decoded as BigInts, so convert them to normal numbers
+			if (value instanceof BigInt64Array || value instanceof BigUint64Array) {
+				value = Array.from(value, Number);
+			}
+			return [value, offset + bytes];
+		}
+		case 255: { // JSON
+			let length = view.getUint32(offset, true);
+			offset += 4;
+			let text = new TextDecoder().decode(new Uint8Array(view.buffer, view.byteOffset + offset, length));
+			return [JSON.parse(text), offset + length];
+		}
+		default:
+			throw "Unknown sensor value type " + tag;
+	}
+}
+
+// Decode a binary sensor message (see sensor_codec.py) into the same object a JSON message would give
+async function decodeSensorMessage(buffer) {
+	let header = new DataView(buffer);
+	let flags = header.getUint8(1);
+	let count = header.getUint16(2, true);
+	let obj = {"sensor_data": {}};
+	let body = buffer.slice(4);
+	// Sequence number
+	if (flags & 0x04) {
+		obj["seq"] = header.getUint32(4, true);
+		body = buffer.slice(8);
+	}
+	// Compressed
+	if (flags & 0x02) {
+		let stream = new Blob([body]).stream().pipeThrough(new DecompressionStream("deflate"));
+		body = await new Response(stream).arrayBuffer();
+	}
+	let view = new DataView(body);
+	// Keyframe
+	if (flags & 0x01) {
+		obj["keyframe"] = true;
+	}
+	let offset = 0;
+	for (let i = 0; i < count; i++) {
+		let id = view.getUint16(offset, true);
+		let value;
+		[value, offset] = decodeSensorValue(view, offset + 2);
+		obj["sensor_data"][sensorIds[id]] = value;
+	}
+	return obj;
+}
+
+// Fill the graphs with recent samples sent by the service, oldest first
+function historyUpdate(history) {
+	Object.entries(history).forEach(([sensor_uid, samples]) => {
+		let first = Math.max(0, samples["time"].length - HISTORY_SAMPLES);
+		for (let i = first; i < samples["time"].length; i++) {
+			let sensor_data;
+			// Multi-sensors have a list of values for each field
+			if (Array.isArray(samples["value"])) {
+				sensor_data = samples["value"][i];
+			}
+			else {
+				sensor_data = {};
+				Object.entries(samples["value"]).forEach(([field, values]) => {
+					sensor_data[field] = values[i];
+				});
+			}
+			updateGraphs(sensor_uid, sensor_data);
+		}
+	});
+}
+
 function sensorUpdate(obj) {
 	// Update sensor monitor (in log modal)
 	$("#sensor_monitor_pre").html(hljs.highlight("JSON", JSON.stringify(obj, null, "\t")).value);
 
 	if("initial_message" in obj) {
 		interfaceLog("info", "sensors", "Received initial message");
+		// Store the integer ID for each sensor, to decode binary messages
+		sensorIds = {};
+		if ("sensor_ids" in obj) {
+			Object.entries(obj["sensor_ids"]).forEach(([sensor_uid, id]) => {
+				sensorIds[id] = sensor_uid;
+			});
+		}
 		requestConfig(function (response) {
 
 			applyConfig(response);
@@ -183,8 +304,10 @@ function sensorUpdate(obj) {
 
 			// Add sensors to graphs
 			response['sensors'].forEach(function (sensor) {
-				// Generate the same unique sensor IDs that SIGHTS generates
-				if (sensor['enabled']) {
+				// Generate the same unique sensor IDs that SIGHTS generates.
+				// A single sensor config entry can create several sensors, using the "count" option.
+				let count = sensor['enabled'] ? (sensor['count'] || 1) : 0;
+				for (let i = 0; i < count; i++) {
 					let type = sensor['type'];
 					if(type in sensorCount) {
 						sensorCount[type] += 1;
@@ -213,7 +336,7 @@ function sensorUpdate(obj) {
 							}
 						});
 					}
-					else { // Else, the sensor has multiple display_on fields (it is a multi-sensor)
+					else if ("display_on" in sensor) { // Else, the sensor has multiple display_on fields (it is a multi-sensor)
 						// For each graph the sensor would like to display_on
 						Object.entries(sensor["display_on"]).forEach(([type, [graph]]) => {
 							// If the graph exists
@@ -249,6 +372,14 @@ function sensorUpdate(obj) {
 			}
 
 			sensorsReady = true;
+
+			if (!demo && sensorSocket.readyState == WebSocket.OPEN) {
+				// Only ask for the sensors that are shown on a graph
+				let shown = Object.keys(sensors).filter(sensor_uid => "display_on" in sensors[sensor_uid]);
+				sensorSocket.send(JSON.stringify({"type": "SUBSCRIBE", "sensors": shown}));
+				// Ask for recent samples so the graphs don't start out empty
+				sensorSocket.send(JSON.stringify({"type": "HISTORY", "sensors": shown, "seconds": 60}));
+			}
 		});
 
 		// Other items in the initial message
@@ -269,6 +400,10 @@ function sensorUpdate(obj) {
 		}
 	}
 
+	if ("history" in obj && sensorsReady) {
+		historyUpdate(obj["history"]);
+	}
+
 	if ("sensor_data" in obj && sensorsReady)  {
 		// For each sensor_data we received
 		Object.entries(obj["sensor_data"]).forEach(([sensor_uid, sensor_data]) => {
@@ -292,7 +427,8 @@ function sensorUpdate(obj) {
 function sensorConnection() {
 	if (!demo) {
 		// Start WebSocket receiver
-		sensorSocket = new WebSocket("ws://" + ip + ":5556");
+		sensorSocket = new WebSocket("ws://" + ip + ":5556", sensorProtocols);
+		sensorSocket.binaryType = "arraybuffer";
 		sensorSocket.onopen = function () {
 			sensorConnected = true;
 			sensorsConnectedAlert();
@@ -308,8 +444,10 @@ function sensorConnection() {
 		};
 		// Setup update event
 		sensorSocket.onmessage = function (event) {
-			let obj = JSON.parse(event.data);
-			sensorUpdate(obj);
+			sensorDecodeQueue = sensorDecodeQueue
+				.then(() => (typeof event.data === "string") ? JSON.parse(event.data) : decodeSensorMessage(event.data))
+				.then(sensorUpdate)
+				.catch((error) => interfaceLog("error", "sensors", "Could not handle sensor message: " + error));
 		}
 	}
 }
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+
+# Poses used when the config doesn't define any, in the same format as the `poses` option of the `arm` config section.
+# The elbow is raised first so that the arm clears the robot while the shoulder and wrist move, and the gripper moves
+# last, once the elbow is back down, as it always has
+DEFAULT_POSES = {
+    "HOME": [
+        {"name": "raise", "move": {"elbow": 4800}},
+        {"name": "joints", "move": {"shoulder": 3712, "wrist": 3456}, "after": ["raise"]},
+        {"name": "lower", "move": {"elbow": 3776}, "after": ["joints"]},
+        {"move": {"gripper": 4112}, "after": ["lower"]}
+    ],
+    "MAPPING": [
+        {"name": "raise", "move": {"elbow": 4800}},
+        {"name": "joints", "move": {"wrist": 3724, "shoulder": 5960}, "after": ["raise"]},
+        {"name": "lower", "move": {"elbow": 3820}, "after": ["joints"]},
+        {"move": {"gripper": 4112}, "after": ["lower"]}
+    ],
+    # Exploring with the camera, without mapping
+    "RUNNING": [
+        {"name": "raise", "move": {"elbow": 4800}},
+        {"name": "joints", "move": {"wrist": 5600, "shoulder": 3712}, "after": ["raise"]},
+        {"name": "lower", "move": {"elbow": 3776}, "after": ["joints"]},
+        {"move": {"gripper": 4112}, "after": ["lower"]}
+    ]
+}
+
+
+# A single step of a pose: servos that start moving together, once the steps it depends on have finished
+class PoseStep:
+    def __init__(self, name, targets, after):
+        self.name = name
+        # Position to move each servo to, by channel
+        self.targets = targets
+        # Names of the steps that have to finish before this one starts
+        self.after = after
+
+
+def load_poses(config):
+    """Load the poses from the `arm` config section, as a dict of pose name: list of PoseStep. Poses that can't be
+    loaded are logged and left out"""
+    logger = logging.getLogger(__name__)
+    # Channel of each part of the arm
+    parts = {part: int(channel) for part, channel in config.items() if part != 'poses'}
+    poses = {}
+    for pose, steps in config.get('poses', DEFAULT_POSES).items():
+        try:
+            poses[pose] = load_pose(steps, parts)
+        except (KeyError, ValueError) as e:
+            logger.error(f"Could not load arm pose '{pose}': {e}")
+    return poses
+
+
+def load_pose(steps, parts):
+    loaded = []
+    names = set()
+    for i, step in enumerate(steps):
+        # Steps can be referred to by name, or by their position in the list
+        name = str(step.get('name', i))
+        if name in names:
+            raise ValueError(f"there is more than one step called '{name}'")
+        names.add(name)
+        for part in step['move']:
+            if part not in parts:
+                raise KeyError(f"unknown part '{part}'")
+        targets = {parts[part]: int(pos) for part, pos in step['move'].items()}
+        # Depending on a step that comes later in the list isn't allowed, so a pose can't wait on itself forever
+        after = [str(dependency) for dependency in step.get('after', [])]
+        for dependency in after:
+            if dependency not in names or dependency == name:
+                raise ValueError(f"step '{name}' comes after '{dependency}', which isn't an earlier step")
+        loaded.append(PoseStep(name, targets, after))
+    return loaded
+
+
+# Runs arm poses (e.g. going to the home position) in the background, so that the control receiver can carry on
+# handling messages, including driving, while the arm moves. Each step of a pose moves its servos at the same time,
+# and starts as soon as the steps it comes after have finished, so a pose takes as long as its slowest chain of steps
+# rather than the sum of every move. Only one pose runs at a time; starting another, or moving the arm by hand,
+# cancels the one that is running. Progress is sent to the sensor stream through the pipe
+class ArmMotion:
+    # How long (in seconds) to wait for the servos of each step to reach their positions before carrying on
+    TIMEOUT = 5
+
+    def __init__(self, servos, pipe, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        self.servos = servos
+        self.pipe = pipe
+        # Steps of each pose, by name
+        self.poses = load_poses(config)
+        # Task running the current pose, if any
+        self.task = None
+
+    def start(self, name):
+        """Start moving to the pose called `name`. Cancels any pose that is already running"""
+        self.cancel()
+        self.task = asyncio.ensure_future(self.run(name, self.poses[name]))
+        return self.task
+
+    def cancel(self):
+        """Stop the current pose, leaving any moving servos to reach their targets. Returns True if there was one
+        running"""
+        if self.task is None or self.task.done():
+            return False
+        self.task.cancel()
+        return True
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def send_progress(self, name, state, step, steps):
+        self.pipe.send(["ARM_MOTION", name, state, step, steps])
+
+    async def run_step(self, step, done):
+        # Wait for the steps this one comes after
+        await asyncio.gather(*(done[dependency] for dependency in step.after))
+        # Set all the targets at once, then wait for every servo to get there in a way that can be cancelled
+        await self.servos.go_to_many_async(step.targets)
+        reached = await asyncio.gather(*(self.servos.wait_for_pos(channel, pos, self.TIMEOUT)
+                                         for channel, pos in step.targets.items()))
+        if not all(reached):
+            self.logger.warning(f"Arm step '{step.name}' did not finish within {self.TIMEOUT}s")
+
+    async def run(self, name, steps):
+        self.logger.info(f"Moving arm to {name}")
+        finished = 0
+        # Task for each step, by name
+        done = {}
+        try:
+            self.send_progress(name, "moving", finished, len(steps))
+            # Steps can only come after earlier steps, so each step's dependencies already have tasks
+            for step in steps:
+                done[step.name] = asyncio.ensure_future(self.run_step(step, done))
+            for task in asyncio.as_completed(list(done.values())):
+                await task
+                finished += 1
+                self.logger.info(f"Moving arm to {name}: {finished}")
+                if finished < len(steps):
+                    self.send_progress(name, "moving", finished, len(steps))
+        except asyncio.CancelledError:
+            self.logger.info(f"Cancelled moving arm to {name} after {finished} of {len(steps)} steps")
+            self.send_progress(name, "cancelled", finished, len(steps))
+            raise
+        except Exception:
+            self.logger.exception(f"Failed to move arm to {name}")
+            self.send_progress(name, "failed", finished, len(steps))
+        else:
+            self.send_progress(name, "done", finished, len(steps))
+        finally:
+            for task in done.values():
+                task.cancel()
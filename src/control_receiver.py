@@ -2,12 +2,14 @@
 #!/usr/bin/env python3
 from motor_handler import MotorHandler
 from servo_handler import ServoHandler
+from arm_motion import ArmMotion
 from websocket_process import WebSocketProcess
 import websockets
 import asyncio
 import os
 import json
 import math
+import time
 import atexit
 import logging
 
@@ -21,6 +23,16 @@ FLAG_ARM = "ARM_MODE_FLAG"
 
 
 class ControlReceiver(WebSocketProcess):
+    # Keyboard controls handled as soon as they are received, ahead of any messages still waiting to be handled.
+    # STOP stops driving, and EMERGENCY_STOP also stops the paddles and the arm
+    STOP_CONTROLS = ["STOP", "EMERGENCY_STOP"]
+    # Keyboard controls that drive the robot
+    DRIVE_CONTROLS = ["FORWARD", "BACKWARDS", "LEFT", "RIGHT"]
+    # Gamepad axes that drive the robot
+    DRIVE_AXES = ["LEFT_STICK_X", "LEFT_STICK_Y", "LEFT_BOTTOM_SHOULDER", "RIGHT_BOTTOM_SHOULDER"]
+    # How long (in seconds) to wait for a stop to be sent before logging that a connection isn't responding
+    STOP_TIMEOUT = 0.5
+
     def __init__(self, mpid, pipe, config_file):
         WebSocketProcess.__init__(self, mpid, pipe, config_file, 5555)
         # Setup logger
@@ -28,6 +40,8 @@ class ControlReceiver(WebSocketProcess):
         # Create MotorHandler object to handle motors
         self.motors: MotorHandler = MotorHandler(self.config)
         self.servos: ServoHandler = ServoHandler(self.config, pipe)
+        # Runs arm pose sequences without holding up other messages
+        self.arm = ArmMotion(self.servos, pipe, self.config['arm'])
         # When script exits or is interrupted stop all motors
         atexit.register(self.motors.close)
         atexit.register(self.servos.close)
@@ -43,9 +57,48 @@ class ControlReceiver(WebSocketProcess):
             "LEFT_TOP_SHOULDER": False,
             "RIGHT_TOP_SHOULDER": False,
         }
+        # How many times a second gamepad input is sent to the motors. When set, gamepad messages only update
+        # self.state and the control loop sends the latest drive mix once per tick, so the motor bus load stays the
+        # same no matter how often the gamepad sends messages. 0 sends a motor command for every message instead
+        self.rate = float(self.config['control'].get('rate', 0))
+        # Which gamepad controls ("STICK" or "TRIGGER") were last moved, if they haven't been sent to the motors yet
+        self.pending_movement = None
+        # Time (in seconds) from receiving the last stop message to every connection it stops having stopped
+        self.stop_latency = None
+
+
+    async def startup(self):
+        if self.rate > 0:
+            self.logger.info(f"Running control loop at {self.rate}Hz")
+            asyncio.ensure_future(self.control_loop())
+
+    async def control_loop(self):
+        period = 1 / self.rate
+        loop = asyncio.get_event_loop()
+        next_tick = loop.time()
+        while True:
+            if self.pending_movement is not None:
+                type, self.pending_movement = self.pending_movement, None
+                try:
+                    await self.send_movement(type)
+                except Exception:
+                    self.logger.exception("Failed to send gamepad movement to motors")
+            # Schedule from the last tick rather than from now, so the rate doesn't drift. If sending took longer
+            # than a tick, skip the missed ticks instead of sending several in a row to catch up
+            next_tick += period
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
 
+    async def gamepad_movement_handler(self, type="TRIGGER"):
+        if self.rate > 0:
+            # Leave it to the control loop to send
+            self.pending_movement = type
+        else:
+            await self.send_movement(type)
 
-    def gamepad_movement_handler(self, type="TRIGGER"):
+    async def send_movement(self, type="TRIGGER"):
         if type == "TRIGGER":
             # Set speed range to be from 0 to `speed`
             left = self.state["LEFT_BOTTOM_SHOULDER"] * self.motors.speed
@@ -56,7 +109,7 @@ class ControlReceiver(WebSocketProcess):
             right *= (-1) ** self.state["RIGHT_TOP_SHOULDER"]
 
             # Send command to servo handler, independent flag allows the two sides to operate independently
-            self.motors.move(left, right, independent=True)
+            await self.motors.move(left, right, independent=True)
         else:
             x = self.state["LEFT_STICK_X"] * -1
             y = self.state["LEFT_STICK_Y"] * -1
@@ -78,21 +131,21 @@ class ControlReceiver(WebSocketProcess):
             left *= self.motors.speed
             right *= self.motors.speed
             # Send command to servos
-            self.motors.move(left, right)
+            await self.motors.move(left, right)
 
 
-    def keyboard_handler(self, control, value):
+    async def keyboard_handler(self, control, value):
         speed = self.motors.speed
         if control == "FORWARD":
-            self.motors.move(speed, speed)
+            await self.motors.move(speed, speed)
         elif control == "BACKWARDS":
-            self.motors.move(-speed, -speed)
+            await self.motors.move(-speed, -speed)
         elif control == "LEFT":
-            self.motors.move(-speed, speed)
+            await self.motors.move(-speed, speed)
         elif control == "RIGHT":
-            self.motors.move(speed, -speed)
-        elif control == "STOP":
-            self.motors.move(0, 0)
+            await self.motors.move(speed, -speed)
+        elif control in self.STOP_CONTROLS:
+            await self.stop(emergency=control == "EMERGENCY_STOP")
         elif control == "SPEED_UP":
             if value == "DOWN":
                 self.motors.speed = min(1023, speed + 128)
@@ -105,79 +158,98 @@ class ControlReceiver(WebSocketProcess):
                 self.pipe.send(["SYNC_SPEED", self.motors.speed])
         elif control == "PADDLE_FORWARD":
             if value == "DOWN":
-                self.motors.move_paddle(speed)
+                await self.motors.move_paddle(speed)
             else:
-                self.motors.stop_paddle()
+                await self.motors.stop_paddle()
         elif control == "PADDLE_REVERSE":
             if value == "DOWN":
-                self.motors.move_paddle(-speed)
+                await self.motors.move_paddle(-speed)
             else:
-                self.motors.stop_paddle()
+                await self.motors.stop_paddle()
         elif control == "ENTER":
             if value == "DOWN":
                 self.state["ARM"] = not self.state["ARM"]
-        elif control == "HOME":
+        elif control in self.arm.poses:
             if value == "DOWN":
-                self.logger.info("GOING HOME")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 4800)
-                self.logger.info("GOING HOME: 1")
-                self.servos.go_to_pos(int(self.config["arm"]["shoulder"]), 3712)
-                self.logger.info("GOING HOME: 2")
-                self.servos.go_to_pos(int(self.config["arm"]["wrist"]), 3456)
-                self.logger.info("GOING HOME: 3")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 3776)
-                self.logger.info("GOING HOME: 4")
-                self.servos.go_to_pos(int(self.config["arm"]["gripper"]), 4112)
-                self.logger.info("GOING HOME: 5")
-        elif control == "MAPPING":
+                # Move the arm in the background, so that driving (and stopping) still works while it moves
+                self.arm.start(control)
+        elif control == "ARM_STOP":
             if value == "DOWN":
-                self.logger.info("GOING MAPPING")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 4800)
-                self.logger.info("GOING MAPPING: 1")
-                self.servos.go_to_pos(int(self.config["arm"]["wrist"]), 3724)
-                self.logger.info("GOING MAPPING: 2")
-                self.servos.go_to_pos(int(self.config["arm"]["shoulder"]), 5960)
-                self.logger.info("GOING MAPPING: 3")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 3820)
-                self.logger.info("GOING MAPPING: 4")
-                self.servos.go_to_pos(int(self.config["arm"]["gripper"]), 4112)
-                self.logger.info("GOING MAPPING: 5")
-        elif control == "RUNNING":
-            if value == "DOWN":
-                self.logger.info("GOING EXPLORING")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 4800)
-                self.logger.info("GOING EXPLORING (but with the camera and without mapping): 1")
-                self.servos.go_to_pos(int(self.config["arm"]["wrist"]), 5600)
-                self.logger.info("GOING EXPLORING (but with the camera and without mapping): 2")
-                self.servos.go_to_pos(int(self.config["arm"]["shoulder"]), 3712)
-                self.logger.info("GOING EXPLORING (but with the camera and without mapping): 3")
-                self.servos.go_to_pos(int(self.config["arm"]["elbow"]), 3776)
-                self.logger.info("GOING EXPLORING (but with the camera and without mapping): 4")
-                self.servos.go_to_pos(int(self.config["arm"]["gripper"]), 4112)
-                self.logger.info("GOING EXPLORING (but with the camera and without mapping): 5")
-
-    def message_handler(self, buf):
-        # Load object from JSON
-        msg = json.loads(buf)
+                self.arm.cancel()
+                await self.servos.stop()
+
+    async def stop(self, emergency=False, received=None):
+        """Stop driving straight away, even if the motors were last sent a stop. An emergency stop also stops the
+        paddles and cancels any arm movement"""
+        if received is None:
+            received = time.perf_counter()
+        # Forget any gamepad movement, so that the control loop doesn't start the motors again
+        self.pending_movement = None
+        for control in self.DRIVE_AXES:
+            self.state[control] = 0.0
+        if emergency:
+            self.arm.cancel()
+            stopped = asyncio.gather(self.motors.emergency_stop(), self.servos.stop())
+        else:
+            stopped = asyncio.ensure_future(self.motors.stop())
+        # A connection that has stopped responding may never send the stop, so only wait so long. Shield it, so the
+        # stop is still sent if the connection recovers
+        try:
+            await asyncio.wait_for(asyncio.shield(stopped), self.STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.error(f"{'Emergency stop' if emergency else 'Stop'} was not sent within {self.STOP_TIMEOUT}s")
+            return
+        except Exception:
+            self.logger.exception(f"Failed to {'emergency stop' if emergency else 'stop'}")
+            return
+        self.stop_latency = time.perf_counter() - received
+        if emergency:
+            self.logger.warning(f"Emergency stop took {self.stop_latency * 1000:.1f}ms")
+        else:
+            self.logger.debug(f"Stop took {self.stop_latency * 1000:.1f}ms")
+
+    def drop_queued(self, queue, emergency=False):
+        # Drop messages that are still waiting to be handled and would start the robot moving again after a stop.
+        # An emergency stop drops everything that is waiting
+        kept = []
+        while not queue.empty():
+            msg = queue.get_nowait()
+            drives = msg["type"] == "AXIS" or (msg["type"] == "KEYBOARD" and msg["control"] in self.DRIVE_CONTROLS)
+            if not emergency and not drives:
+                kept.append(msg)
+        for msg in kept:
+            queue.put_nowait(msg)
+
+    async def handle_messages(self, queue):
+        # Handle the messages from one client, one at a time in the order they were received
+        while True:
+            msg = await queue.get()
+            try:
+                await self.message_handler(msg)
+            except Exception:
+                self.logger.exception(f"Failed to handle message {msg}")
 
+    async def message_handler(self, msg):
         typ = msg["type"]  # axis, button, or keyboard
         control = msg["control"]  # FACE_0, LEFT_STICK_Y, SPEED_UP etc.
 
         if typ == "KEYBOARD":
             value = msg["value"] if "value" in msg else False  # UP, DOWN
             # Handle directional movement etc
-            self.keyboard_handler(control, value)
+            await self.keyboard_handler(control, value)
         elif typ == "SLIDER":
             value = int(msg["value"])
             self.logger.info("Slider value type is {}".format(type(value)))
-            self.servos.go_to_pos_async(int(self.config["arm"][control]), value)
+            # Moving the arm by hand takes over from any pose it is moving to
+            self.arm.cancel()
+            await self.servos.go_to_pos_async(int(self.config["arm"][control]), value)
         elif typ == "BUTTON":
             value = msg["value"]  # UP, DOWN
             # Store in state, because it might be useful (e.g. for modifiers)
             self.state[control] = True if value == "DOWN" else False
             # 
             if control == "LEFT_TOP_SHOULDER" or control == "RIGHT_TOP_SHOULDER":
-                self.gamepad_movement_handler(type="TRIGGER")
+                await self.gamepad_movement_handler(type="TRIGGER")
             # Then handle any button events
             if control == "DPAD_LEFT":
                 if value == "DOWN":
@@ -189,14 +261,14 @@ class ControlReceiver(WebSocketProcess):
                     self.pipe.send(["SYNC_SPEED", self.motors.speed])
             elif control == "DPAD_UP":
                 if value == "DOWN":
-                    self.keyboard_handler("PADDLE_FORWARD", self.motors.speed)
+                    await self.keyboard_handler("PADDLE_FORWARD", self.motors.speed)
                 elif value == "UP":
-                    self.motors.stop_paddle()
+                    await self.motors.stop_paddle()
             elif control == "DPAD_DOWN":
                 if value == "DOWN":
-                    self.keyboard_handler("PADDLE_REVERSE", self.motors.speed)
+                    await self.keyboard_handler("PADDLE_REVERSE", self.motors.speed)
                 elif value == "UP":
-                    self.motors.stop_paddle()
+                    await self.motors.stop_paddle()
         elif typ == "AXIS":
             # If axis, store as float
             value = float(msg["value"])
@@ -204,23 +276,41 @@ class ControlReceiver(WebSocketProcess):
             self.state[control] = value
             # Handle trigger and stick controls
             if control == "LEFT_STICK_X" or control == "LEFT_STICK_Y":
-                self.gamepad_movement_handler(type="STICK")
+                await self.gamepad_movement_handler(type="STICK")
             else:
-                self.gamepad_movement_handler(type="TRIGGER")
+                await self.gamepad_movement_handler(type="TRIGGER")
 
     def get_initial_messages(self):
         return self.servos.get_initial_messages()
 
     async def main(self, websocket, path):
+        # Messages are handled in the background, so that stop messages can be handled as soon as they are received
+        # rather than waiting behind messages that are still being handled
+        queue = asyncio.Queue()
+        handler = asyncio.ensure_future(self.handle_messages(queue))
         # Enter runtime loop
-        while True:
-            # Receive JSON formatted string from websocket
-            try:
-                buf = await websocket.recv()
-            except websockets.exceptions.ConnectionClosed:
-                break
-            if len(buf) > 0:
-                if self.config['debug']['print_messages']:
-                    self.logger.info(buf)
-                # Convert string data to object and then handle controls
-                self.message_handler(buf)
+        try:
+            while True:
+                # Receive JSON formatted string from websocket
+                try:
+                    buf = await websocket.recv()
+                except websockets.exceptions.ConnectionClosed:
+                    break
+                received = time.perf_counter()
+                if len(buf) > 0:
+                    if self.config['debug']['print_messages']:
+                        self.logger.info(buf)
+                    # Convert string data to object and then handle controls
+                    msg = json.loads(buf)
+                    if msg["type"] == "KEYBOARD" and msg["control"] in self.STOP_CONTROLS:
+                        # Releasing a stop key doesn't stop again, which would drop anything sent while it was held
+                        if msg.get("value") != "UP":
+                            emergency = msg["control"] == "EMERGENCY_STOP"
+                            self.drop_queued(queue, emergency)
+                            # Don't wait for the stop to be sent before reading the next message, so that a
+                            # connection that has stopped responding can't hold up later stops (e.g. an emergency stop)
+                            asyncio.ensure_future(self.stop(emergency, received))
+                    else:
+                        queue.put_nowait(msg)
+        finally:
+            handler.cancel()
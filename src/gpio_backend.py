@@ -0,0 +1,96 @@
+import logging
+import threading
+
+
+def load_gpio(backend='gpio'):
+    """Get the GPIO module to use. 'gpio' uses the Raspberry Pi GPIO module, or the Jetson one if that isn't
+    available. 'fake' uses in-memory pins, for testing sensor wrappers without any hardware"""
+    if backend == 'fake':
+        return fake_gpio
+    # Try importing the RPi GPIO module but don't throw an error if it fails, instead try to import the Jetson one
+    # If that fails too, let it throw an error
+    try:
+        import RPi.GPIO as GPIO
+    except ImportError:
+        import Jetson.GPIO as GPIO
+    return GPIO
+
+
+# Stand-in for the RPi.GPIO module, with the subset of its API used by sensor wrappers. Input pins can be set with
+# set_input(), which calls any edge detection callbacks just like a real pin would
+class FakeGPIO:
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.mode = None
+        # Current level of each pin that has been set up
+        self.pins = {}
+        # Edge detection (edge, callbacks) for each pin
+        self.events = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=PUD_OFF, initial=0):
+        with self.lock:
+            if direction == self.IN:
+                # Pulled up inputs read high until something pulls them low
+                self.pins[pin] = 1 if pull_up_down == self.PUD_UP else 0
+            else:
+                self.pins[pin] = initial
+
+    def input(self, pin):
+        return self.pins[pin]
+
+    def output(self, pin, value):
+        self.set_input(pin, value)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self.lock:
+            self.events[pin] = (edge, [callback] if callback is not None else [])
+
+    def add_event_callback(self, pin, callback):
+        with self.lock:
+            self.events[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        with self.lock:
+            self.events.pop(pin, None)
+
+    def set_input(self, pin, value):
+        """Set the level of a pin, calling any callbacks waiting for that edge (on the calling thread)"""
+        with self.lock:
+            old = self.pins.get(pin, 0)
+            self.pins[pin] = value = int(bool(value))
+            edge, callbacks = self.events.get(pin, (None, []))
+            callbacks = list(callbacks)
+        if value == old:
+            return
+        if edge == self.BOTH or (edge == self.RISING and value) or (edge == self.FALLING and not value):
+            for callback in callbacks:
+                callback(pin)
+
+    def cleanup(self, pin=None):
+        with self.lock:
+            if pin is None:
+                self.pins = {}
+                self.events = {}
+            else:
+                self.pins.pop(pin, None)
+                self.events.pop(pin, None)
+
+
+# Shared by every sensor using the fake backend, so that tests can set its pins
+fake_gpio = FakeGPIO()
@@ -0,0 +1,147 @@
+import ctypes
+import logging
+import threading
+from smbus2 import SMBus, i2c_msg
+
+
+# An I2C bus shared between sensors. Sensors are read from multiple threads, so every transaction holds the bus lock
+class SharedBus:
+    # Maximum number of messages the kernel accepts in a single I2C_RDWR call
+    MAX_MESSAGES = 42
+
+    def __init__(self, number, bus):
+        self.number = number
+        self.bus = bus
+        self.lock = threading.RLock()
+
+    def read_byte_data(self, address, register):
+        with self.lock:
+            return self.bus.read_byte_data(address, register)
+
+    def write_byte_data(self, address, register, value):
+        with self.lock:
+            self.bus.write_byte_data(address, register, value)
+
+    def read_word_data(self, address, register):
+        with self.lock:
+            return self.bus.read_word_data(address, register)
+
+    def read_i2c_block_data(self, address, register, length):
+        with self.lock:
+            return self.bus.read_i2c_block_data(address, register, length)
+
+    def write_i2c_block_data(self, address, register, data):
+        with self.lock:
+            self.bus.write_i2c_block_data(address, register, data)
+
+    def transfer(self, *messages):
+        # Run raw i2c_msg messages as a single combined transaction
+        with self.lock:
+            self.bus.i2c_rdwr(*messages)
+
+    def read_block(self, address, register, length):
+        """Read `length` bytes starting at `register`, in a single transaction"""
+        return self.read_blocks([(address, register, length)])[0]
+
+    def read_blocks(self, requests):
+        """Read several blocks, possibly from different devices on this bus, back to back. Takes a list of
+        (address, register, length) and returns a list of bytes in the same order"""
+        messages = []
+        reads = []
+        for address, register, length in requests:
+            read = i2c_msg.read(address, length)
+            messages += [i2c_msg.write(address, [register]), read]
+            reads.append(read)
+        with self.lock:
+            # Each request takes a write (to set the register) and a read
+            for i in range(0, len(messages), self.MAX_MESSAGES):
+                self.bus.i2c_rdwr(*messages[i:i + self.MAX_MESSAGES])
+        return [bytes(read) for read in reads]
+
+    def close(self):
+        with self.lock:
+            self.bus.close()
+
+
+# Owns every I2C bus used by sensors, so that sensors on the same bus share one open handle
+class BusManager:
+    def __init__(self, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # Either 'smbus' for real hardware, or 'fake' for testing without any
+        self.backend = config.get('backend', 'smbus')
+        self.buses = {}
+        self.lock = threading.Lock()
+
+    def get(self, number=1):
+        """Get the shared bus for /dev/i2c-<number>, opening it if needed"""
+        with self.lock:
+            if number not in self.buses:
+                if self.backend == 'fake':
+                    bus = FakeSMBus(number)
+                else:
+                    bus = SMBus(number)
+                self.buses[number] = SharedBus(number, bus)
+                self.logger.info(f"Opened I2C bus {number} ({self.backend})")
+            return self.buses[number]
+
+    def close(self):
+        with self.lock:
+            for bus in self.buses.values():
+                bus.close()
+            self.buses = {}
+
+
+# Stand-in for smbus2.SMBus that keeps the registers of each device in memory, for testing sensors without hardware.
+# Devices are created with registers set to 0 the first time they are used, and can be set up with set_registers()
+class FakeSMBus:
+    def __init__(self, bus=None):
+        self.bus = bus
+        # 256 registers for each device address
+        self.devices = {}
+        # Register that the next read from each device starts at
+        self.pointers = {}
+
+    def device(self, address):
+        if address not in self.devices:
+            self.devices[address] = bytearray(256)
+            self.pointers[address] = 0
+        return self.devices[address]
+
+    def set_registers(self, address, register, data):
+        self.device(address)[register:register + len(data)] = bytes(data)
+
+    def read_byte_data(self, address, register):
+        return self.device(address)[register]
+
+    def write_byte_data(self, address, register, value):
+        self.device(address)[register] = value
+
+    def read_word_data(self, address, register):
+        registers = self.device(address)
+        return registers[register] | registers[register + 1] << 8
+
+    def read_i2c_block_data(self, address, register, length):
+        return list(self.device(address)[register:register + length])
+
+    def write_i2c_block_data(self, address, register, data):
+        self.set_registers(address, register, data)
+
+    def i2c_rdwr(self, *messages):
+        for message in messages:
+            registers = self.device(message.addr)
+            pointer = self.pointers[message.addr]
+            if message.flags & 0x0001:  # I2C_M_RD
+                # Read from the current register, auto-incrementing
+                data = bytes(registers[pointer:pointer + message.len])
+                ctypes.memmove(message.buf, data, len(data))
+                self.pointers[message.addr] = pointer + message.len
+            else:
+                # The first byte written sets the register, anything after that is written to the registers
+                data = bytes(message)
+                if data:
+                    self.pointers[message.addr] = data[0]
+                    self.set_registers(message.addr, data[0], data[1:])
+
+    def close(self):
+        pass
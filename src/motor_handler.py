@@ -3,7 +3,9 @@ import logging
 import serial
 import os
 import traceback
-from plugin_system import PluginManager
+import asyncio
+from plugin_system import PluginManager, call_plugin_now
+from motor_worker import MotorWorker
 from motor_wrapper import MotorWrapper
 from motors.virtual import VirtualConnection
 
@@ -55,49 +57,61 @@ class MotorHandler:
         self.last_right = 0
         # Ensure Connection class has access to logging capabilities
         self.connection.logger = self.logger
+        # Each connection is driven by its own worker thread, so that the event loop only has to post new speeds
+        # and never waits for the motors to reply
+        self.worker = MotorWorker(self.connection, "motors")
+        self.paddle_worker = MotorWorker(self.paddle_connection, "paddles")
 
-    def stop(self):
-        # Set all servos to 0
-        self.connection.stop()
+    async def stop(self):
+        # Always send the stop, even if the last command sent was already 0
         self.last_left = 0
         self.last_right = 0
+        # Set all servos to 0, and wait until that has been sent
+        await self.worker.stop()
+
+    async def emergency_stop(self):
+        """Stop the motors and paddles at the same time, dropping any commands that haven't been sent yet"""
+        await asyncio.gather(self.stop(), self.stop_paddle())
 
     def close(self):
         self.logger.info("Closing motor connection")
         # Set all servos to 0 and close connection
-        self.connection.stop()
+        self.worker.close()
+        call_plugin_now(self.connection.stop)
         self.connection.close()
 
-    def move(self, left, right, independent=False):
+    async def move(self, left, right, independent=False):
         # Make sure we don't have any decimals
         left = round(left)
         right = round(right)
 
+        # Work out what to send, and store this message for comparison next time
+        last_left, last_right = self.last_left, self.last_right
+        self.last_left = left
+        self.last_right = right
+
         if independent:
             # Allow left and right to be independent
-            if left != self.last_left:
-                self.connection.move_raw(left=left)
-            if right != self.last_right:
-                self.connection.move_raw(right=right)
+            if left != last_left:
+                self.worker.move(left=left)
+            if right != last_right:
+                self.worker.move(right=right)
         else:
             # Not independent, both left and right must have changed
-            if left != self.last_left and right != self.last_right:
-                self.connection.move_raw(left, right)
-
-        # Store this message for comparison next time
-        self.last_left = left
-        self.last_right = right
+            if left != last_left and right != last_right:
+                self.worker.move(left, right)
 
-    def move_paddle(self, speed):
+    async def move_paddle(self, speed):
         self.logger.info(f"Gonna move that paddle at a speed of Mach {speed}")
-        self.paddle_connection.move_raw(left=speed, right=speed)
+        self.paddle_worker.move(left=speed, right=speed)
 
-    def stop_paddle(self):
-        # Set all servos to 0
-        self.paddle_connection.stop()
+    async def stop_paddle(self):
+        # Set all servos to 0, and wait until that has been sent
+        await self.paddle_worker.stop()
 
     def close_paddle(self):
         self.logger.info("Closing Paddle connection")
         # Set all servos to 0 and close connection
-        self.paddle_connection.stop()
+        self.paddle_worker.close()
+        call_plugin_now(self.paddle_connection.stop)
         self.paddle_connection.close()
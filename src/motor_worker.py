@@ -0,0 +1,107 @@
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import threading
+
+
+# Drives one motor connection from its own thread, so that slow serial round-trips never hold up the event loop.
+# Moves are posted to a mailbox that only keeps the latest speed for each side: if the connection is still busy with
+# the last write, newer moves replace any that haven't been sent yet, so the motors always get the most recent speed
+# as soon as the connection can take it. Stops clear the mailbox and are sent before anything posted after them
+class MotorWorker:
+    def __init__(self, connection, name):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        self.connection = connection
+        self.name = name
+        self.condition = threading.Condition()
+        # Latest speed for each side that hasn't been sent yet
+        self.left = None
+        self.right = None
+        # Futures waiting for the next stop to be sent, if one has been asked for
+        self.stops = []
+        # Number of moves replaced before they were sent
+        self.dropped = 0
+        self.closed = False
+        # The thread is only started when it is first needed, since it won't survive the process being forked
+        self.thread = None
+        # Event loop that async connections are run on
+        self.loop = None
+
+    def start(self):
+        if self.thread is None:
+            self.loop = asyncio.get_event_loop()
+            self.thread = threading.Thread(target=self.run, name=f"{self.name}-worker", daemon=True)
+            self.thread.start()
+
+    def move(self, left=None, right=None):
+        """Post new speeds for either or both sides, without waiting for them to be sent"""
+        with self.condition:
+            self.start()
+            if left is not None:
+                if self.left is not None:
+                    self.dropped += 1
+                self.left = left
+            if right is not None:
+                if self.right is not None:
+                    self.dropped += 1
+                self.right = right
+            self.condition.notify()
+
+    def stop(self):
+        """Stop the motors, dropping any moves that haven't been sent yet. Returns an asyncio future that is done once
+        the stop has been sent"""
+        future = concurrent.futures.Future()
+        with self.condition:
+            self.start()
+            self.left = None
+            self.right = None
+            self.stops.append(future)
+            self.condition.notify()
+        return asyncio.wrap_future(future)
+
+    def call(self, method, *args, **kwargs):
+        # Async connections are run on the event loop, while this thread waits for them to finish
+        if inspect.iscoroutinefunction(method):
+            return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self.loop).result()
+        return method(*args, **kwargs)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.stops and self.left is None and self.right is None:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                stops, self.stops = self.stops, []
+                left, right = self.left, self.right
+                self.left = None
+                self.right = None
+            # Stopping clears the mailbox, so any moves taken from it were posted after the stop and are sent after it
+            if stops:
+                self.send_stop(stops)
+            if left is not None or right is not None:
+                try:
+                    self.call(self.connection.move_raw, left=left, right=right)
+                except Exception:
+                    self.logger.exception(f"Failed to move {self.name}")
+
+    def send_stop(self, futures):
+        try:
+            self.call(self.connection.stop)
+        except Exception as e:
+            self.logger.exception(f"Failed to stop {self.name}")
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(None)
+
+    def close(self):
+        """Stop the thread, once it has finished anything it is sending"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1)
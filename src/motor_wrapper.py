@@ -15,3 +15,13 @@ class MotorWrapper:
 
     def close(self):
         pass
+
+
+# Motor handlers that communicate without blocking (e.g. with asyncio serial or network connections) inherit this
+# class instead. Its methods are awaited in the event loop, rather than run in a worker thread
+class AsyncMotorWrapper(MotorWrapper):
+    async def move_raw(self, left=None, right=None):
+        pass
+
+    async def stop(self):
+        pass
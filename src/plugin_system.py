@@ -1,4 +1,6 @@
 import os
+import asyncio
+import functools
 import logging
 import importlib
 import re
@@ -40,7 +42,8 @@ class PluginManager:
                 # To find the correct class, we check if it's a subclass of SensorWrapper / BaseConnection (and is
                 # not that class itself)
                 self.logger.debug(c)
-                if c[1] != self.base_class and issubclass(c[1], self.base_class):
+                # Classes without a type_ (e.g. AsyncSensorWrapper) are base classes too
+                if c[1] != self.base_class and issubclass(c[1], self.base_class) and hasattr(c[1], 'type_'):
                     # We've found the sensor wrapper class
                     class_ = c[1]
             # Assign the discovered class to the appropriate key (eg. assign MLX90614Wrapper class to sensors of type
@@ -78,3 +81,19 @@ class PluginManager:
             self.logger.error(
                 "Couldn't find sensor plugin directory. SIGHTS is possibly running in wrong working directory.")
         return registered_plugins
+
+
+async def call_plugin(method, executor, *args, **kwargs):
+    """Call a plugin method from the event loop. Async plugins are awaited directly, while sync plugins are run in
+    the given executor so that they don't block the event loop"""
+    if inspect.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+    return await asyncio.get_event_loop().run_in_executor(executor, functools.partial(method, *args, **kwargs))
+
+
+def call_plugin_now(method, *args, **kwargs):
+    """Call a plugin method from outside the event loop (e.g. when exiting), waiting for it to finish"""
+    result = method(*args, **kwargs)
+    if inspect.iscoroutine(result):
+        return asyncio.get_event_loop().run_until_complete(result)
+    return result
@@ -0,0 +1,79 @@
+import logging
+import math
+import numbers
+from array import array
+
+
+# Summarises the samples a sensor takes over a reporting window, so a sensor can be read quickly (e.g. to catch
+# spikes) while only sending a handful of values per window. Samples are buffered in arrays, and each statistic is
+# worked out over the whole buffer at once when the window ends
+class WindowAggregator:
+    # Statistics that can be sent, and how each is worked out from a window of samples
+    STATS = {
+        'min': min,
+        'max': max,
+        'mean': lambda samples: math.fsum(samples) / len(samples),
+        'last': lambda samples: samples[-1]
+    }
+
+    def __init__(self, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # Length of each reporting window, in seconds
+        self.window = float(config.get('window', 1))
+        # Which statistics to send at the end of each window
+        self.stats = []
+        for stat in config.get('stats', list(self.STATS)):
+            if stat in self.STATS:
+                self.stats.append(stat)
+            else:
+                self.logger.error(f"Unknown aggregate statistic '{stat}'. Options are: {', '.join(self.STATS)}")
+        # Samples in the current window, for each field (None for sensors with a single value)
+        self.buffers = {}
+        # When the current window started
+        self.start = None
+
+    def key(self, field, stat):
+        # Multi-sensors send each statistic for each of their fields, e.g. "x_max"
+        return stat if field is None else f"{field}_{stat}"
+
+    def add(self, data, now):
+        """Add a sample taken at time `now`. Returns the statistics for the window once it has ended, otherwise None"""
+        if self.start is None:
+            self.start = now
+        if isinstance(data, dict):
+            values = data.items()
+        else:
+            values = [(None, data)]
+        for field, value in values:
+            # Only numbers can be aggregated
+            if isinstance(value, numbers.Real):
+                if field not in self.buffers:
+                    self.buffers[field] = array('d')
+                self.buffers[field].append(value)
+        if now - self.start < self.window:
+            return None
+        return self.flush(now)
+
+    def flush(self, now):
+        result = {}
+        for field, samples in self.buffers.items():
+            if samples:
+                for stat in self.stats:
+                    result[self.key(field, stat)] = self.STATS[stat](samples)
+        # Reuse the buffers for the next window
+        for samples in self.buffers.values():
+            del samples[:]
+        self.start = now
+        return result or None
+
+    def initial(self, initial_data):
+        # Each statistic has the same initial data (e.g. the limit on a circle graph) as the value it summarises
+        if initial_data is None:
+            return None
+        # Multi-sensors have initial data for each of their fields, e.g. {"x": {"limit": 10}}, which is sent for each
+        # statistic of that field, e.g. "x_max"
+        if isinstance(initial_data, dict) and initial_data and all(isinstance(data, dict)
+                                                                   for data in initial_data.values()):
+            return {self.key(field, stat): data for field, data in initial_data.items() for stat in self.stats}
+        return {self.key(None, stat): initial_data for stat in self.stats}
@@ -0,0 +1,188 @@
+import array
+import json
+import struct
+import sys
+import zlib
+# orjson is much faster than the json module, but optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Element types of array sensor values (from the array module, or numpy if a sensor uses it). The index of each is
+# used to identify it in binary messages
+DTYPES = ['int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64', 'float32', 'float64']
+
+
+def is_array(value):
+    return isinstance(value, array.array) or hasattr(value, 'dtype')
+
+
+def array_dtype(value):
+    """Name of the element type of an array, e.g. 'float32'"""
+    if isinstance(value, array.array):
+        if value.typecode in 'fd':
+            kind = 'float'
+        elif value.typecode.isupper():
+            kind = 'uint'
+        else:
+            kind = 'int'
+        return f"{kind}{value.itemsize * 8}"
+    return str(value.dtype)
+
+
+def array_bytes(value):
+    # Raw array data, little-endian
+    if isinstance(value, array.array):
+        if sys.byteorder == 'big':
+            value = array.array(value.typecode, value)
+            value.byteswap()
+        return value.tobytes()
+    return value.astype(value.dtype.newbyteorder('<'), copy=False).tobytes()
+
+
+def to_json(value):
+    # Arrays are sent as lists in JSON
+    if is_array(value):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=to_json, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            # e.g. integers too large for orjson
+            pass
+    return json.dumps(value, default=to_json)
+
+
+# Plain JSON, used by clients that don't ask for anything else. Most sensors don't change between messages, so the
+# encoded JSON of each sensor's value is cached and only encoded again once the value changes
+class JSONCodec:
+    # No WebSocket subprotocol is needed for JSON
+    subprotocol = None
+
+    def __init__(self):
+        # Sensor uid -> (value, encoded '"uid": value' fragment)
+        self.fragments = {}
+
+    def fragment(self, uid, value):
+        cached = self.fragments.get(uid)
+        # Compare types too, since e.g. 1 == 1.0 == True but they are encoded differently. Arrays are always encoded
+        # again, since they almost always change and may have been changed in place
+        if cached is None or is_array(value) or type(cached[0]) is not type(value) or cached[0] != value:
+            # Keep a copy of dicts and lists, so a sensor that changes and returns the same one each time still gets
+            # encoded again
+            snapshot = dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+            cached = (snapshot, dumps(uid) + ": " + dumps(value))
+            self.fragments[uid] = cached
+        return cached[1]
+
+    def encode(self, msg):
+        # Only sensor data messages are built from cached fragments, anything else is encoded as a whole
+        if "sensor_data" not in msg or not set(msg) <= {"sensor_data", "keyframe", "seq"}:
+            return dumps(msg)
+        parts = ['{"sensor_data": {', ", ".join(self.fragment(uid, value) for uid, value in msg["sensor_data"].items()),
+                 "}"]
+        for key in ("seq", "keyframe"):
+            if key in msg:
+                parts.append(f', "{key}": {dumps(msg[key])}')
+        parts.append("}")
+        return "".join(parts)
+
+
+# Compact binary encoding for sensor data messages. Sensors are identified by the small integer IDs assigned in the
+# initial message ("sensor_ids"), rather than by their uid strings. Anything that isn't sensor data is still sent as JSON.
+#
+# Layout (little-endian):
+#   header:  version (u8), flags (u8), sensor count (u16), then sequence number (u32) if FLAG_SEQ is set
+#   body:    for each sensor: id (u16), then a tagged value
+#   value:   tag (u8), followed by:
+#     TAG_NULL:   nothing
+#     TAG_INT:    i32
+#     TAG_FLOAT:  f64
+#     TAG_DICT:   field count (u8), then for each field: key length (u8), key (utf-8), tagged value
+#     TAG_ARRAY:  element type (u8, index into DTYPES), element count (u32), then the elements
+#     TAG_JSON:   length (u32), value as JSON (utf-8)
+# If FLAG_COMPRESSED is set, the body is zlib compressed.
+class BinaryCodec:
+    VERSION = 1
+
+    FLAG_KEYFRAME = 0x01
+    FLAG_COMPRESSED = 0x02
+    FLAG_SEQ = 0x04
+
+    TAG_NULL = 0
+    TAG_INT = 1
+    TAG_FLOAT = 2
+    TAG_DICT = 3
+    TAG_ARRAY = 4
+    TAG_JSON = 255
+
+    HEADER = struct.Struct("<BBH")
+    UINT8 = struct.Struct("<B")
+    UINT16 = struct.Struct("<H")
+    UINT32 = struct.Struct("<I")
+    INT = struct.Struct("<i")
+    FLOAT = struct.Struct("<d")
+
+    def __init__(self, sensor_ids, compress=False, compress_threshold=256):
+        # Sensor uid -> integer ID lookup table
+        self.sensor_ids = sensor_ids
+        # Whether large messages are compressed, and how large a message has to be (in bytes) to be compressed
+        self.compress = compress
+        self.compress_threshold = compress_threshold
+        self.subprotocol = "sights.bin.v1.deflate" if compress else "sights.bin.v1"
+
+    def encode_value(self, value, out):
+        if value is None:
+            out.append(self.UINT8.pack(self.TAG_NULL))
+        # Booleans are sent as integers
+        elif isinstance(value, int) and -2 ** 31 <= value < 2 ** 31:
+            out.append(self.UINT8.pack(self.TAG_INT))
+            out.append(self.INT.pack(value))
+        elif isinstance(value, (int, float)):
+            out.append(self.UINT8.pack(self.TAG_FLOAT))
+            out.append(self.FLOAT.pack(value))
+        elif isinstance(value, dict) and len(value) < 256:
+            out.append(self.UINT8.pack(self.TAG_DICT))
+            out.append(self.UINT8.pack(len(value)))
+            for key, field in value.items():
+                key = str(key).encode('utf-8')
+                out.append(self.UINT8.pack(len(key)))
+                out.append(key)
+                self.encode_value(field, out)
+        # Arrays are sent as packed binary, rather than as a list of numbers
+        elif is_array(value) and array_dtype(value) in DTYPES:
+            out.append(self.UINT8.pack(self.TAG_ARRAY))
+            out.append(self.UINT8.pack(DTYPES.index(array_dtype(value))))
+            out.append(self.UINT32.pack(len(value) if isinstance(value, array.array) else value.size))
+            out.append(array_bytes(value))
+        # Fall back to JSON for anything else
+        else:
+            data = dumps(value).encode('utf-8')
+            out.append(self.UINT8.pack(self.TAG_JSON))
+            out.append(self.UINT32.pack(len(data)))
+            out.append(data)
+
+    def encode(self, msg):
+        # Only messages that are purely sensor data are sent in binary
+        if "sensor_data" not in msg or not set(msg) <= {"sensor_data", "keyframe", "seq"}:
+            return dumps(msg)
+        flags = self.FLAG_KEYFRAME if msg.get("keyframe") else 0
+        header = []
+        if "seq" in msg:
+            flags |= self.FLAG_SEQ
+            header.append(self.UINT32.pack(msg["seq"] & 0xFFFFFFFF))
+        body = []
+        for uid, value in msg["sensor_data"].items():
+            body.append(self.UINT16.pack(self.sensor_ids[uid]))
+            self.encode_value(value, body)
+        body = b"".join(body)
+        if self.compress and len(body) >= self.compress_threshold:
+            body = zlib.compress(body)
+            flags |= self.FLAG_COMPRESSED
+        return self.HEADER.pack(self.VERSION, flags, len(msg["sensor_data"])) + b"".join(header) + body
@@ -0,0 +1,60 @@
+import numbers
+import time
+from sensor_codec import is_array
+
+
+# Reduces sensor stream bandwidth by only sending sensor values that have changed by more than the sensor's deadband.
+# Every so often a keyframe containing the latest value of every sensor is sent, so clients never stay out of date
+class DeltaEncoder:
+    def __init__(self, config):
+        # Either send every reading ('full'), or only readings that have changed ('delta')
+        self.enabled = config.get('encoding', 'full') == 'delta'
+        # How often (in seconds) to send a keyframe
+        self.keyframe_interval = float(config.get('keyframe_interval', 10))
+        # Time the next keyframe is due
+        self.next_keyframe = 0
+        # The last value sent for each sensor uid
+        self.last_sent = {}
+        # The latest value read for each sensor uid, whether or not it was sent
+        self.latest = {}
+
+    @staticmethod
+    def changed(old, new, deadband):
+        # Numbers have changed if they have moved by more than the deadband
+        if isinstance(old, numbers.Real) and isinstance(new, numbers.Real):
+            return abs(new - old) > deadband if deadband > 0 else new != old
+        # Multi-sensors have changed if any one of their values has changed
+        if isinstance(old, dict) and isinstance(new, dict):
+            if old.keys() != new.keys():
+                return True
+            return any(DeltaEncoder.changed(old[key], new[key], deadband) for key in new)
+        # Arrays have changed if any one of their elements has changed
+        if is_array(old) and is_array(new):
+            if len(old) != len(new):
+                return True
+            return any(DeltaEncoder.changed(a, b, deadband) for a, b in zip(old, new))
+        # Anything else (strings, lists etc.) is compared exactly
+        return old != new
+
+    def encode(self, readings, now=None):
+        """Takes a list of (sensor, uid, data) readings and returns the sensor_data dict to send, and whether or
+        not it is a keyframe"""
+        if now is None:
+            now = time.monotonic()
+        for sensor, uid, data in readings:
+            self.latest[uid] = data
+        # Delta encoding is disabled, so send every reading
+        if not self.enabled:
+            return {uid: data for sensor, uid, data in readings}, False
+        # Send the latest value of every sensor
+        if now >= self.next_keyframe:
+            self.next_keyframe = now + self.keyframe_interval
+            self.last_sent.update(self.latest)
+            return dict(self.latest), True
+        # Only send sensors that have changed since they were last sent
+        sensor_data = {}
+        for sensor, uid, data in readings:
+            if uid not in self.last_sent or self.changed(self.last_sent[uid], data, sensor.deadband):
+                sensor_data[uid] = data
+                self.last_sent[uid] = data
+        return sensor_data, False
@@ -0,0 +1,96 @@
+import asyncio
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Runs sensor reads in a bounded pool of worker threads, so that a slow or blocking sensor
+# (I2C, serial, GPIO, psutil etc.) doesn't stall the event loop or the other sensors. Async sensors are awaited directly
+class SensorEngine:
+    def __init__(self, config, health):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # Maximum number of sensors that can be read at the same time
+        self.workers = int(config.get('workers', 4))
+        # Default time (in seconds) a sensor has to return its data before it is skipped for that tick
+        self.timeout = float(config.get('timeout', 0.5))
+        # Thread pool that the sensor reads are run in
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sensor")
+        # Reads that are still in progress, stored by sensor
+        self.pending = {}
+        # Sensors whose read in progress has already missed its deadline
+        self.late = set()
+        # Records how long each read takes and whether it failed (a HealthMonitor)
+        self.health = health
+
+    def get_timeout(self, sensor):
+        # Sensors can override the default timeout in their config
+        return sensor.timeout if sensor.timeout is not None else self.timeout
+
+    @staticmethod
+    def call(sensor):
+        # Runs in a worker thread. Times just the call itself, not time spent waiting for a free thread
+        start = time.perf_counter()
+        try:
+            return sensor.get_data(), time.perf_counter() - start
+        except Exception as e:
+            # Keep the time taken, so failed reads still show up in the sensor's latency
+            e.latency = time.perf_counter() - start
+            raise
+
+    @staticmethod
+    async def call_async(sensor):
+        # Async sensors are awaited in the event loop instead of using a worker thread
+        start = time.perf_counter()
+        try:
+            return await sensor.get_data(), time.perf_counter() - start
+        except Exception as e:
+            e.latency = time.perf_counter() - start
+            raise
+
+    def read_finished(self, sensor, future):
+        self.pending.pop(sensor, None)
+        # Record how long reads that missed their deadline actually took
+        if sensor in self.late:
+            self.late.discard(sensor)
+            if not future.cancelled() and future.exception() is None:
+                self.health.finished(sensor, future.result()[1])
+
+    async def read(self, sensor):
+        # Sensors that keep failing are left alone for a while
+        if self.health.quarantined(sensor, time.monotonic()):
+            return sensor, None
+        # A read that timed out on a previous tick may still be running. Don't queue up another read behind it,
+        # just skip the sensor until it has finished
+        if sensor in self.pending:
+            self.logger.debug(f"Sensor '{sensor.name}' is still busy, skipping")
+            # Only count it as missed if the read in progress has already run past its timeout. A sensor that is just
+            # slower than its period is read again on its first tick after the read finishes
+            if sensor in self.late:
+                self.health.miss(sensor)
+            return sensor, None
+        if inspect.iscoroutinefunction(sensor.get_data):
+            future = asyncio.ensure_future(self.call_async(sensor))
+        else:
+            future = asyncio.get_event_loop().run_in_executor(self.executor, self.call, sensor)
+        self.pending[sensor] = future
+        future.add_done_callback(lambda f: self.read_finished(sensor, f))
+        try:
+            # Shield the read so that a timeout doesn't try to cancel a call that's already running in a thread
+            data, latency = await asyncio.wait_for(asyncio.shield(future), self.get_timeout(sensor))
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Sensor '{sensor.name}' took longer than {self.get_timeout(sensor)}s, skipping")
+            self.late.add(sensor)
+            self.health.miss(sensor)
+            return sensor, None
+        except Exception as e:
+            self.logger.exception(f"Sensor '{sensor.name}' failed to get data")
+            self.health.error(sensor, getattr(e, 'latency', 0))
+            return sensor, None
+        self.health.success(sensor, latency)
+        return sensor, data
+
+    def close(self):
+        # Don't wait for any reads that are stuck
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,105 @@
+import bisect
+import logging
+import time
+
+
+# Read statistics for a single sensor
+class SensorStats:
+    def __init__(self, buckets):
+        # Number of reads that took up to each bucket's time, plus one more bucket for anything longer
+        self.histogram = [0] * (len(buckets) + 1)
+        self.reads = 0
+        self.errors = 0
+        # Reads that timed out, or were skipped because the previous read was still running
+        self.missed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # Failed reads in a row, and when the sensor is next allowed to be read if it has been quarantined
+        self.failures = 0
+        self.quarantined_until = 0
+        self.quarantine_time = 0
+
+
+# Keeps track of how long each sensor takes to read and how often it fails, and quarantines sensors that keep
+# failing so that they don't keep tying up worker threads. This shows whether the hardware or the software is slow
+class HealthMonitor:
+    # Upper bound of each latency histogram bucket, in milliseconds
+    BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # How often (in seconds) health is sent to clients. 0 disables sending it
+        self.interval = float(config.get('interval', 5))
+        # Number of failed reads in a row before a sensor is quarantined
+        self.quarantine_after = int(config.get('quarantine_after', 5))
+        # How long (in seconds) a sensor is first quarantined for. This doubles each time it is quarantined again,
+        # up to max_quarantine_time
+        self.quarantine_time = float(config.get('quarantine_time', 5))
+        self.max_quarantine_time = float(config.get('max_quarantine_time', 300))
+        # Stats for each sensor
+        self.sensors = {}
+
+    def get(self, sensor):
+        if sensor not in self.sensors:
+            self.sensors[sensor] = SensorStats(self.BUCKETS)
+        return self.sensors[sensor]
+
+    def quarantined(self, sensor, now):
+        return now < self.get(sensor).quarantined_until
+
+    def success(self, sensor, latency):
+        stats = self.get(sensor)
+        self.record_latency(stats, latency)
+        if stats.failures >= self.quarantine_after:
+            self.logger.info(f"Sensor '{sensor.name}' has recovered")
+        stats.failures = 0
+        stats.quarantine_time = 0
+
+    def error(self, sensor, latency):
+        stats = self.get(sensor)
+        self.record_latency(stats, latency)
+        stats.errors += 1
+        self.failure(sensor, stats)
+
+    def miss(self, sensor):
+        stats = self.get(sensor)
+        stats.missed += 1
+        self.failure(sensor, stats)
+
+    def finished(self, sensor, latency):
+        # A read that missed its deadline has now finished, so record how long it actually took
+        self.record_latency(self.get(sensor), latency)
+
+    def record_latency(self, stats, latency):
+        stats.reads += 1
+        stats.total_latency += latency
+        stats.max_latency = max(stats.max_latency, latency)
+        stats.histogram[bisect.bisect_left(self.BUCKETS, latency * 1000)] += 1
+
+    def failure(self, sensor, stats):
+        stats.failures += 1
+        if stats.failures >= self.quarantine_after:
+            # Back off for longer each time the sensor fails again
+            stats.quarantine_time = min(max(stats.quarantine_time * 2, self.quarantine_time), self.max_quarantine_time)
+            stats.quarantined_until = time.monotonic() + stats.quarantine_time
+            self.logger.warning(f"Sensor '{sensor.name}' failed {stats.failures} times in a row, not reading it for "
+                                f"{stats.quarantine_time}s")
+
+    def report(self):
+        """Stats for every sensor, by uid, to send to clients"""
+        now = time.monotonic()
+        sensors = {}
+        for sensor, stats in self.sensors.items():
+            sensors[sensor.uid] = {
+                "reads": stats.reads,
+                "errors": stats.errors,
+                "missed": stats.missed,
+                # Latencies in milliseconds
+                "mean_latency": round(stats.total_latency / stats.reads * 1000, 2) if stats.reads else None,
+                "max_latency": round(stats.max_latency * 1000, 2),
+                "histogram": stats.histogram,
+                # Seconds until the sensor is read again, if it has been quarantined
+                "quarantined": round(max(0, stats.quarantined_until - now), 1)
+            }
+        return {"buckets": self.BUCKETS, "sensors": sensors}
@@ -0,0 +1,113 @@
+import math
+import numbers
+from array import array
+
+
+# Fixed size, array backed ring buffer of (time, sequence number, values) samples. Memory use is fixed when the buffer
+# is created, no matter how long the sensor runs for
+class RingBuffer:
+    def __init__(self, capacity, fields=None):
+        self.capacity = capacity
+        # Field names for multi-sensors, or None for sensors that have a single value
+        self.fields = fields
+        self.times = array('d', [0.0]) * capacity
+        self.seqs = array('Q', [0]) * capacity
+        self.values = {field: array('d', [0.0]) * capacity for field in (fields or [None])}
+        # Physical index of the oldest sample, and the number of samples stored
+        self.start = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, t, seq, value):
+        if self.length < self.capacity:
+            i = (self.start + self.length) % self.capacity
+            self.length += 1
+        else:
+            # Full, so overwrite the oldest sample
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[i] = t
+        self.seqs[i] = seq
+        for field, values in self.values.items():
+            if field is not None:
+                value_ = value.get(field) if isinstance(value, dict) else None
+            else:
+                value_ = value
+            values[i] = to_float(value_)
+
+    def index(self, key, target):
+        # Binary search for the first (logical) index where key[index] > target. Times and sequence numbers only
+        # ever increase, so both are sorted
+        low, high = 0, self.length
+        while low < high:
+            mid = (low + high) // 2
+            if key[(self.start + mid) % self.capacity] > target:
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    def slice(self, first):
+        # Return every sample from the logical index `first` onwards, in order, as columns
+        indices = [(self.start + i) % self.capacity for i in range(first, self.length)]
+        values = {field: [from_float(values[i]) for i in indices] for field, values in self.values.items()}
+        return {
+            "time": [self.times[i] for i in indices],
+            "value": values[None] if self.fields is None else values
+        }
+
+    def since_time(self, t):
+        return self.slice(self.index(self.times, t))
+
+    def since_seq(self, seq):
+        return self.slice(self.index(self.seqs, seq))
+
+
+def to_float(value):
+    # Values that can't be stored as a number (e.g. missing or text) are stored as NaN
+    if isinstance(value, numbers.Real):
+        return float(value)
+    return math.nan
+
+
+def from_float(value):
+    # NaN isn't valid JSON
+    return None if math.isnan(value) else value
+
+
+# Keeps a ring buffer of recent samples for every sensor, so clients can catch up on what they missed
+class SensorHistory:
+    def __init__(self, config):
+        # Number of samples kept for each sensor. 0 disables history
+        self.capacity = int(config.get('history', 600))
+        self.enabled = self.capacity > 0
+        # Buffer for each sensor uid
+        self.buffers = {}
+
+    def record(self, uid, t, seq, value):
+        if not self.enabled:
+            return
+        if uid not in self.buffers:
+            # Only numbers and multi-sensors of numbers can be stored
+            if isinstance(value, dict):
+                self.buffers[uid] = RingBuffer(self.capacity, list(value))
+            elif isinstance(value, numbers.Real):
+                self.buffers[uid] = RingBuffer(self.capacity)
+            else:
+                return
+        self.buffers[uid].append(t, seq, value)
+
+    def get(self, uids, since_time=None, since_seq=None):
+        """Returns samples for each of the requested sensor uids (or all sensors if uids is None) newer than
+        either since_time or since_seq"""
+        history = {}
+        for uid, buffer in self.buffers.items():
+            if uids is not None and uid not in uids:
+                continue
+            if since_seq is not None:
+                history[uid] = buffer.since_seq(since_seq)
+            else:
+                history[uid] = buffer.since_time(since_time or 0)
+        return history
@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import logging
+import time
+
+
+# A message waiting to be sent, which is only encoded once for each codec no matter how many clients use that codec
+class HubMessage:
+    def __init__(self, msg, created=None):
+        self.msg = msg
+        self.encoded = {}
+        # When the message was produced, used to tell how stale it is
+        self.created = time.monotonic() if created is None else created
+
+    def encode(self, codec):
+        if codec not in self.encoded:
+            self.encoded[codec] = codec.encode(self.msg)
+        return self.encoded[codec]
+
+    def merge(self, newer):
+        """Combine this message with a newer one, keeping the newest value of everything in either"""
+        msg = dict(self.msg)
+        msg.update(newer.msg)
+        if "sensor_data" in self.msg and "sensor_data" in newer.msg:
+            msg["sensor_data"] = {**self.msg["sensor_data"], **newer.msg["sensor_data"]}
+        if "arm_position" in self.msg and "arm_position" in newer.msg:
+            positions = {p["target"]: p for p in self.msg["arm_position"] + newer.msg["arm_position"]}
+            msg["arm_position"] = list(positions.values())
+        # A merged keyframe still contains every sensor
+        if self.msg.get("keyframe") or newer.msg.get("keyframe"):
+            msg["keyframe"] = True
+        return HubMessage(msg, newer.created)
+
+
+# A connected sensor stream client, with its own queue of messages waiting to be sent
+class HubClient:
+    def __init__(self, websocket, codec, queue_size, max_age):
+        self.websocket = websocket
+        self.address = websocket.remote_address[0]
+        # How messages are encoded for this client (e.g. JSON or binary)
+        self.codec = codec
+        # Messages waiting to be sent. Once there are more than queue_size, or they are older than max_age seconds,
+        # the oldest are merged into the next one so that only the latest value of each sensor is sent
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.max_age = max_age
+        # Set while there are messages waiting to be sent
+        self.ready = asyncio.Event()
+        # Number of messages that were merged into a newer one rather than being sent
+        self.dropped = 0
+        # Minimum time (in seconds) between values for each sensor uid the client has subscribed to, or None if the
+        # client wants every sensor
+        self.subscription = None
+        # When each sensor was last sent to the client, and values held back because they were sent too recently
+        self.last_sent = {}
+        self.pending = {}
+        # Sequence number of the newest message with a value in pending
+        self.pending_seq = None
+        # Timer that sends held back values once their rate limit allows, so they are sent even if no newer message
+        # comes along (e.g. a delta encoded sensor that has stopped changing)
+        self.flush_timer = None
+
+    def subscribe(self, sensors, rate=None):
+        """Only send the given sensor uids to this client. `sensors` is either a list of uids, or a dict of uid to
+        maximum rate (in Hz, None for no limit). `rate` is the maximum rate for any sensor without its own.
+        Subscribing to None sends every sensor again"""
+        if sensors is None:
+            self.subscription = None
+        else:
+            if not isinstance(sensors, dict):
+                sensors = dict.fromkeys(sensors)
+            self.subscription = {}
+            for uid, uid_rate in sensors.items():
+                uid_rate = rate if uid_rate is None else uid_rate
+                self.subscription[uid] = 1 / float(uid_rate) if uid_rate else 0
+        self.last_sent = {}
+        self.pending = {}
+        self.cancel_flush()
+
+    def filter(self, msg, now):
+        # Returns the part of a message this client has subscribed to, or None if there is nothing left to send
+        if self.subscription is None or "sensor_data" not in msg:
+            return msg
+        for uid, data in msg["sensor_data"].items():
+            if uid in self.subscription:
+                self.pending[uid] = data
+                self.pending_seq = msg["seq"]
+        sensor_data = {}
+        # Send the latest value of each sensor that hasn't been sent within its rate limit
+        for uid in list(self.pending):
+            if now - self.last_sent.get(uid, 0) >= self.subscription[uid]:
+                sensor_data[uid] = self.pending.pop(uid)
+                self.last_sent[uid] = now
+        filtered = {key: value for key, value in msg.items() if key not in ("sensor_data", "seq", "keyframe")}
+        if sensor_data:
+            filtered["sensor_data"] = sensor_data
+            filtered["seq"] = msg["seq"]
+            if msg.get("keyframe"):
+                filtered["keyframe"] = True
+        if self.pending and self.flush_timer is None:
+            # Send whatever is still held back as soon as the first of it is allowed
+            due = min(self.last_sent.get(uid, 0) + self.subscription[uid] for uid in self.pending)
+            self.flush_timer = asyncio.get_event_loop().call_later(max(0, due - now), self.flush)
+        return filtered or None
+
+    def flush(self):
+        self.flush_timer = None
+        if self.subscription is None or not self.pending:
+            return
+        # Filter an empty message, which sends any held back values that are now due and sets the timer again for
+        # any that still aren't
+        filtered = self.filter({"sensor_data": {}, "seq": self.pending_seq}, time.monotonic())
+        if filtered is not None:
+            self.put(HubMessage(filtered))
+
+    def cancel_flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+    def put(self, message):
+        # This never waits for the client, so a slow client can't make the sampler wait
+        self.queue.append(message)
+        if len(self.queue) > self.queue_size:
+            self.drop_oldest()
+        self.ready.set()
+
+    def drop_oldest(self):
+        # Merge the oldest message into the next one, so none of its values are lost unless they have been replaced
+        if len(self.queue) < 2:
+            return
+        oldest = self.queue.popleft()
+        self.queue[0] = oldest.merge(self.queue[0])
+        self.dropped += 1
+
+    async def get(self):
+        # Wait for the next message, skipping over any that have become too old while waiting to be sent
+        while not self.queue:
+            self.ready.clear()
+            await self.ready.wait()
+        now = time.monotonic()
+        while len(self.queue) > 1 and now - self.queue[0].created > self.max_age:
+            self.drop_oldest()
+        return self.queue.popleft()
+
+
+# Fans out each message produced by the single sampling task to every connected client
+class BroadcastHub:
+    def __init__(self, config, codecs):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # Maximum number of messages waiting to be sent to each client
+        self.queue_size = max(1, int(config.get('client_queue', 16)))
+        # Maximum age (in seconds) of messages waiting to be sent, before they are merged into newer ones
+        self.max_age = float(config.get('client_max_age', 1))
+        # Available codecs, by WebSocket subprotocol. The codec for None is used when no subprotocol is negotiated
+        self.codecs = codecs
+        # Connected clients
+        self.clients = set()
+        # Set while there is at least one client connected
+        self.has_clients = asyncio.Event()
+
+    def register(self, websocket):
+        codec = self.codecs.get(websocket.subprotocol, self.codecs[None])
+        client = HubClient(websocket, codec, self.queue_size, self.max_age)
+        self.clients.add(client)
+        self.has_clients.set()
+        self.logger.debug(f"Registered client ({client.address}) using {websocket.subprotocol or 'json'}, "
+                          f"{len(self.clients)} connected")
+        return client
+
+    def unregister(self, client):
+        self.clients.discard(client)
+        client.cancel_flush()
+        if not self.clients:
+            self.has_clients.clear()
+        self.logger.debug(f"Unregistered client ({client.address}), {len(self.clients)} connected")
+        if client.dropped:
+            self.logger.info(f"Client ({client.address}) couldn't keep up, {client.dropped} messages were merged "
+                             f"into newer ones")
+
+    def stats(self):
+        # Messages waiting to be sent and merged (dropped) for each connected client
+        return [{"address": client.address, "queued": len(client.queue), "dropped": client.dropped}
+                for client in self.clients]
+
+    async def wait_for_clients(self):
+        await self.has_clients.wait()
+
+    def publish(self, msg):
+        # Queue message for every client. This never blocks, so one slow client can't hold up the others
+        message = HubMessage(msg)
+        now = time.monotonic()
+        for client in self.clients:
+            filtered = client.filter(msg, now)
+            if filtered is msg:
+                client.put(message)
+            elif filtered is not None:
+                # Clients that have subscribed to a subset of sensors get their own copy of the message
+                client.put(HubMessage(filtered))
+
+    async def send(self, client, msg):
+        # Send a message straight to one client, encoded for that client
+        await client.websocket.send(client.codec.encode(msg))
+
+    async def serve(self, client):
+        # Send queued messages to the client until it disconnects
+        while True:
+            message = await client.get()
+            await client.websocket.send(message.encode(client.codec))
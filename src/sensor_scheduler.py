@@ -0,0 +1,57 @@
+import asyncio
+import heapq
+import itertools
+
+
+# Priority queue of sensors, ordered by the next time each sensor is due to be read. This lets the sensor stream
+# sleep until exactly when the next sensor needs reading, instead of waking up to check every sensor on a fixed tick
+class SensorScheduler:
+    # Period used for sensors that don't have a valid period, matching the old fixed poll rate
+    DEFAULT_PERIOD = 0.05
+
+    def __init__(self):
+        # Heap of (due time, insertion order, sensor). Insertion order breaks ties between sensors due at the same time
+        self.queue = []
+        self.counter = itertools.count()
+        # Set when a sensor's next read is moved, so that the sensor stream can stop sleeping and work out how long it
+        # should sleep for again
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, sensor, due=0):
+        # By default a new sensor is due straight away, since we need some data on the graph
+        heapq.heappush(self.queue, (due, next(self.counter), sensor))
+
+    def remove(self, sensor):
+        self.queue = [entry for entry in self.queue if entry[2] is not sensor]
+        heapq.heapify(self.queue)
+
+    def reschedule(self, sensor, now):
+        # Move the sensor's next read forward to match its (shorter) period, e.g. when an adaptive sensor speeds up
+        self.remove(sensor)
+        self.add(sensor, max(now, sensor.last_run + self.get_period(sensor)))
+        self.wakeup.set()
+
+    def next_due(self):
+        # Time the next sensor is due, or None if there are no sensors
+        return self.queue[0][0] if self.queue else None
+
+    def get_period(self, sensor):
+        return sensor.period if sensor.period > 0 else self.DEFAULT_PERIOD
+
+    def pop_due(self, now):
+        # Return every sensor that is due, and schedule its next read
+        ready = []
+        while self.queue and self.queue[0][0] <= now:
+            due, _, sensor = heapq.heappop(self.queue)
+            ready.append(sensor)
+            # Keep to the sensor's period by scheduling from when it was due rather than when it actually ran,
+            # unless we've fallen a whole period behind, in which case skip ahead rather than trying to catch up
+            next_run = due + self.get_period(sensor)
+            if next_run <= now:
+                next_run = now + self.get_period(sensor)
+            sensor.last_run = now
+            heapq.heappush(self.queue, (next_run, next(self.counter), sensor))
+        return ready
@@ -1,7 +1,19 @@
 #!/usr/bin/env python3
-from smbus2 import SMBus
 from websocket_process import WebSocketProcess
 from sensor_wrapper import SensorWrapper
+from sensor_engine import SensorEngine
+from sensor_health import HealthMonitor
+from sensor_scheduler import SensorScheduler
+from sensor_hub import BroadcastHub
+from sensor_delta import DeltaEncoder
+from sensor_codec import JSONCodec, BinaryCodec
+from sensor_history import SensorHistory
+from sensor_aggregate import WindowAggregator
+from system_stats import SystemStats
+from telemetry import TelemetryRecorder
+from i2c_bus import BusManager
+import atexit
+import functools
 import importlib
 import websockets
 import asyncio
@@ -35,50 +47,166 @@ class SensorStream(WebSocketProcess):
         # Create list of sensors
         self.sensors = []
 
+        # I2C buses are shared between all sensors, and opened when a sensor first asks for one
+        self.buses = BusManager(self.config.get('sensor_stream', {}).get('i2c', {}))
+        SensorWrapper.buses = self.buses
+        # Host metrics are also shared, so they are read once however many system sensors there are
+        self.stats = SystemStats(self.config.get('sensor_stream', {}))
+        SensorWrapper.stats = self.stats
+
+        # Keeps track of how long each sensor takes to read, and how often it fails
+        self.health = HealthMonitor(self.config.get('sensor_stream', {}).get('health', {}))
+        # Sensor reads are run in a thread pool so that they can't block the event loop
+        self.engine = SensorEngine(self.config.get('sensor_stream', {}), self.health)
+        # Sensors are read when they are due, in order of when they are next due
+        self.scheduler = SensorScheduler()
+        # Optionally only send sensor values that have changed
+        self.delta = DeltaEncoder(self.config.get('sensor_stream', {}))
+        # Integer ID assigned to each sensor uid, sent in the initial message and used by the binary codec
+        self.sensor_ids = {}
+        # Recent samples from each sensor, so clients can fill in their graphs after (re)connecting
+        self.history = SensorHistory(self.config.get('sensor_stream', {}))
+        # Optionally record every reading to disk, for analysis after a run
+        self.recorder = TelemetryRecorder(self.config.get('sensor_stream', {}).get('recorder', {}))
+        # Sequence number of the latest sensor data message
+        self.seq = 0
+        # Reads that are still running, and readings waiting to be sent
+        self.reads = set()
+        self.readings = []
+        # Cached static parts of the initial message sent to each client, and the config file's modification time
+        # when they were built
+        self.init_info = None
+        self.init_info_mtime = None
+        # Latest speed and arm servo positions received from ControlReceiver, for the initial message
+        self.speed = None
+        self.arm_positions = {}
+        if self.init_msgs is not None and "SERVO_POS" in self.init_msgs:
+            for target, position in self.init_msgs["SERVO_POS"]:
+                self.arm_positions[target] = position
+
         # Load sensors from config file
         for sensor_config in self.config['sensors']:
             if sensor_config.get('enabled', False):
-                # Find the appropriate wrapper class and create the sensor object
-                type_ = sensor_config['type']
-                sensor = self.pm.wrappers[type_](sensor_config)
-                # Count the number of times we create a sensor of this type, to assign a unique id
-                if type_ not in self.sensor_count:
-                    self.sensor_count[type_] = 1
-                else:
-                    self.sensor_count[type_] += 1
-                # Assign index
-                sensor.index = self.sensor_count[type_]
-                # Add to list of sensors
-                self.sensors.append(sensor)
-                self.logger.info(f"Created sensor of type '{type_}' (#{sensor.index})")
+                # A single config entry can create several identical sensors (e.g. for load testing)
+                for i in range(int(sensor_config.get('count', 1))):
+                    self.add_sensor(sensor_config)
         self.logger.info(f"Loaded {len(self.sensors)} sensors")
 
-    def get_data(self):
-        # Create empty message
-        msg = {}
+        # Clients can ask for the sensor stream in binary (optionally compressed) by requesting the relevant
+        # subprotocol. Otherwise it is sent as JSON
+        stream_config = self.config.get('sensor_stream', {})
+        compress_threshold = int(stream_config.get('compress_threshold', 256))
+        codecs = [JSONCodec(),
+                  BinaryCodec(self.sensor_ids),
+                  BinaryCodec(self.sensor_ids, compress=True, compress_threshold=compress_threshold)]
+        codecs = {codec.subprotocol: codec for codec in codecs}
+        self.subprotocols = [protocol for protocol in codecs if protocol is not None]
+        # Each message is produced once by a single sampling task and then sent to every connected client
+        self.hub = BroadcastHub(stream_config, codecs)
 
-        # Ensure that the time is the same across sensors
-        now = time.time()
+    def add_sensor(self, sensor_config):
+        # Find the appropriate wrapper class and create the sensor object
+        type_ = sensor_config['type']
+        sensor = self.pm.wrappers[type_](sensor_config)
+        # Count the number of times we create a sensor of this type, to assign a unique id
+        if type_ not in self.sensor_count:
+            self.sensor_count[type_] = 1
+        else:
+            self.sensor_count[type_] += 1
+        # Assign index
+        sensor.index = self.sensor_count[type_]
+        # Generate UID for sensor, and a shorter integer ID
+        sensor.uid = f"{type_}_{sensor.index}"
+        sensor.id = len(self.sensors)
+        # Sensors can be read at their period but only send statistics (min, max etc.) over a longer window
+        if 'aggregate' in sensor_config:
+            sensor.aggregator = WindowAggregator(sensor_config['aggregate'])
+        else:
+            sensor.aggregator = None
+        self.sensor_ids[sensor.uid] = sensor.id
+        # Add to list of sensors
+        self.sensors.append(sensor)
+        # Schedule the first read
+        self.scheduler.add(sensor)
+        self.logger.info(f"Created sensor of type '{type_}' (#{sensor.index})")
 
-        # Get data from each Sensor
-        for sensor in self.sensors:
-            # Ensure time elapsed is greater than period
-            if sensor.is_ready(now):
-                data = sensor.get_data()
-                # Make sure we actually got data from the sensor
-                if data is not None:
-                    # Generate UID for sensor
-                    uid = f"{sensor.type_}_{sensor.index}"
-                    # Any sensor data handled automatically (anything in this for loop) goes in the "sensor_data" dict
-                    if "sensor_data" not in msg:
-                        msg["sensor_data"] = {}
-                    # Create message
-                    msg["sensor_data"][uid] = data
+    def start_reads(self):
+        # Start a read for every sensor that is due. Each read is its own task, so a slow sensor doesn't hold up the
+        # others or the next tick
+        for sensor in self.scheduler.pop_due(time.monotonic()):
+            task = asyncio.ensure_future(self.read_sensor(sensor))
+            self.reads.add(task)
+            task.add_done_callback(self.reads.discard)
+
+    async def read_sensor(self, sensor):
+        try:
+            sensor, data = await self.engine.read(sensor)
+            # Adaptive sensors speed up as soon as their value starts changing, rather than after their next read
+            if data is not None and sensor.adapt(data):
+                self.scheduler.reschedule(sensor, time.monotonic())
+            # Aggregated sensors only have data to send at the end of each window
+            if data is not None and sensor.aggregator is not None:
+                data = sensor.aggregator.add(data, time.monotonic())
+            # Make sure we actually got data from the sensor
+            if data is not None:
+                self.queue_reading(sensor, data)
+        except Exception:
+            self.logger.exception(f"Failed to handle data from sensor '{sensor.name}'")
+
+    def queue_reading(self, sensor, data):
+        # Readings that finish at about the same time are sent together, on the next pass of the event loop
+        if not self.readings:
+            asyncio.get_event_loop().call_soon(self.publish_readings)
+        self.readings.append((sensor, sensor.uid, data))
+
+    def publish_readings(self):
+        readings, self.readings = self.readings, []
+        try:
+            msg = self.build_message(readings)
+            if msg:
+                self.hub.publish(msg)
+        except Exception:
+            self.logger.exception("Failed to publish sensor data")
+
+    def build_message(self, readings):
+        # Create empty message
+        msg = {}
+        # Every reading is kept in the history, even if it isn't sent
+        if readings:
+            self.seq += 1
+            now = time.time()
+            for sensor, uid, data in readings:
+                self.history.record(uid, now, self.seq, data)
+            self.recorder.record(now, self.seq, [(uid, data) for sensor, uid, data in readings])
+        # Drop any values that haven't changed enough to be worth sending (if delta encoding is enabled)
+        sensor_data, keyframe = self.delta.encode(readings)
+        # Any sensor data handled automatically goes in the "sensor_data" dict
+        if sensor_data:
+            msg["sensor_data"] = sensor_data
+            # Clients can use the sequence number to ask for anything they missed
+            msg["seq"] = self.seq
+            if keyframe:
+                msg["keyframe"] = True
         # Print out each message if print_messages is enabled
         if self.config['debug']['print_messages'] and bool(msg):
             self.logger.info(msg)
         # Return message to be sent to control panel
-        return json.dumps(msg)
+        return msg
+
+    def push_reading(self, sensor, data):
+        # Send data pushed by a sensor (e.g. from an interrupt) straight away, without waiting for the next sample
+        if data is None:
+            return
+        try:
+            msg = self.build_message([(sensor, sensor.uid, data)])
+            if msg:
+                self.hub.publish(msg)
+        except Exception:
+            self.logger.exception(f"Failed to send data pushed by sensor '{sensor.name}'")
+
+    def pipe_reader(self):
+        # Called by the event loop when there is a message waiting in the pipe
+        asyncio.ensure_future(self.pipe_message_handler(self.pipe.recv()))
 
     async def pipe_message_handler(self, msg):
         # If we receive a message from ControlReceiver with a new speed, set that to our speed
@@ -86,91 +214,207 @@ class SensorStream(WebSocketProcess):
             await self.send_speed_value(msg[1])
         elif msg[0] == "SERVO_POS":
             await self.send_pos_value(msg[1], msg[2])
+        elif msg[0] == "ARM_MOTION":
+            # Progress of an arm pose sequence
+            _, pose, state, step, steps = msg
+            self.hub.publish({"arm_motion": {"pose": pose, "state": state, "step": step, "steps": steps}})
 
     async def send_pos_value(self, target, value):
         msg = {"arm_position": [{"target": target, "position": value}]}
-        await self.websocket.send(json.dumps(msg))
+        self.arm_positions[target] = value
+        self.hub.publish(msg)
         self.logger.debug("Synchronised {} position".format(target))
 
     async def send_speed_value(self, speed):
         # Create message with type and value of the speed
         msg = {"speed": speed}
+        # Remember the speed, for the initial message of clients that connect later
+        self.speed = speed
         # Send current speed to be displayed on the interface
-        await self.websocket.send(json.dumps(msg))
+        self.hub.publish(msg)
         self.logger.debug("Synchronised speed setting")
 
-    async def send_init_info(self):
-        msg = {}
-        if self.init_msgs is not None:
-            for message in self.init_msgs:
-                if message == "SERVO_POS":
-                    pos = []
-                    for sp in self.init_msgs[message]:
-                        pos.append({"target": sp[0], "position": sp[1]})
-                    msg["arm_position"] = pos
-
-        msg["initial_message"] = True
+    def build_init_info(self, config):
+        # The parts of the initial message that don't change while the process is running. These are only worked
+        # out once (and again if the config file changes), so that clients can reconnect quickly
+        msg = {"initial_message": True}
         msg["running_config"] = os.path.basename(self.config_file)
         # Even though these are part of the config object, we send them separately
         # Since we don't want the speed resetting every time we edit the config 
-        msg["speed"] = self.config['control']['default_speed'] * 128 - 1
-        # System uptime, as time in seconds since boot
-        with open('/proc/uptime', 'r') as f:
-            msg["uptime"] = round(float(f.readline().split()[0]))
+        msg["default_speed"] = config['control']['default_speed'] * 128 - 1
         # Send software versions
-        msg["version_sights"] = subprocess.check_output(["git", "describe"]).strip().decode('utf-8')
+        try:
+            msg["version_sights"] = subprocess.check_output(["git", "describe"]).strip().decode('utf-8')
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.logger.warning(f"Could not get SIGHTS version: {e}")
+            msg["version_sights"] = "unknown"
         # msg["version_vision"] = subprocess.check_output(["git", "describe"],
         #                                                  cwd="../SIGHTSVision/").strip().decode('utf-8')
         msg["available_plugins"] = self.pm.plugins
-        # Get intital data from each Sensor
+        # Integer IDs that identify each sensor in binary messages
+        msg["sensor_ids"] = self.sensor_ids
+        # Get the inital data from each sensor (stuff that only needs to be sent once, at the start)
         for sensor in self.sensors:
-            # Send both the normal data from the sensor 
-            data = sensor.get_data()
-            # As well as the inital data (stuff that only needs to be sent once, at the start)
             initial_data = sensor.get_initial()
-            # Generate UID for sensor
-            uid = f"{sensor.type_}_{sensor.index}"
-            # Make sure we actually got data from the sensor
-            if data is not None:
-                # Any sensor data handled automatically (anything in this for loop) goes in the "sensor_data" dict
-                if "sensor_data" not in msg:
-                    msg["sensor_data"] = {}
-                # Create message
-                msg["sensor_data"][uid] = data
+            if sensor.aggregator is not None:
+                initial_data = sensor.aggregator.initial(initial_data)
             # Make sure we actually got data from the sensor
             if initial_data is not None:
-                # Any sensor data handled automatically (anything in this for loop) goes in the "sensor_data" dict
                 if "initial_sensor_data" not in msg:
                     msg["initial_sensor_data"] = {}
-                # Create message
-                msg["initial_sensor_data"][uid] = initial_data
+                msg["initial_sensor_data"][sensor.uid] = initial_data
+        return msg
+
+    def get_init_info(self):
+        # Rebuild the static parts of the initial message if the config file has been changed since they were built
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+        except OSError:
+            mtime = self.init_info_mtime
+        if self.init_info is None or mtime != self.init_info_mtime:
+            config = self.config
+            if self.init_info is not None:
+                self.logger.info("Config file changed, rebuilding initial message")
+                try:
+                    config = json.load(open(self.config_file))
+                except (OSError, ValueError) as e:
+                    self.logger.warning(f"Could not reload config file: {e}")
+            self.init_info = self.build_init_info(config)
+            self.init_info_mtime = mtime
+        return self.init_info
+
+    async def send_init_info(self, client):
+        msg = dict(self.get_init_info())
+        # The current position of each arm servo
+        if self.arm_positions:
+            msg["arm_position"] = [{"target": target, "position": position}
+                                   for target, position in self.arm_positions.items()]
+        # Current speed, or the default speed if it hasn't been changed yet
+        default_speed = msg.pop("default_speed")
+        msg["speed"] = default_speed if self.speed is None else self.speed
+        # System uptime, as time in seconds since boot
+        msg["uptime"] = round(time.time() - self.boot_time)
+        # Sequence number of the latest sensor data
+        msg["seq"] = self.seq
+        # The latest value read from each sensor, rather than reading every sensor again
+        if self.delta.latest:
+            msg["sensor_data"] = dict(self.delta.latest)
         # Send message to interface
-        await self.websocket.send(json.dumps(msg))
+        await self.hub.send(client, msg)
         self.logger.debug("Sent initial message")
 
-    async def main(self, websocket, path):
-        self.logger.info(f"New client connected ({websocket.remote_address[0]})")
-        # Store websocket
-        self.websocket = websocket
-        # Send the initial info to notify interface that the service is ready.
-        await self.send_init_info()
-        # Enter runtime loop
+    async def client_message_handler(self, client, msg):
+        typ = msg["type"]
+        if typ == "HISTORY":
+            # Samples from the last `seconds` seconds, for the requested sensors (or every sensor)
+            since = time.time() - float(msg.get("seconds", 60))
+            history = self.history.get(msg.get("sensors"), since_time=since)
+        elif typ == "RESUME":
+            # Samples newer than the last sequence number the client received
+            history = self.history.get(msg.get("sensors"), since_seq=int(msg["seq"]))
+        elif typ == "SUBSCRIBE":
+            # Only send the requested sensors to this client, optionally at a limited rate
+            client.subscribe(msg.get("sensors"), msg.get("rate"))
+            self.logger.debug(f"Client ({client.address}) subscribed to {msg.get('sensors')}")
+            return
+        else:
+            self.logger.warning(f"Unknown message type '{typ}' from client ({client.address})")
+            return
+        # Send the samples for every sensor back in one message
+        await self.hub.send(client, {"history": history, "seq": self.seq})
+
+    async def receive(self, client):
+        # Handle requests from the client until it disconnects
+        while True:
+            buf = await client.websocket.recv()
+            if len(buf) > 0:
+                if self.config['debug']['print_messages']:
+                    self.logger.info(buf)
+                try:
+                    await self.client_message_handler(client, json.loads(buf))
+                except (ValueError, KeyError, TypeError) as e:
+                    self.logger.warning(f"Invalid message from client ({client.address}): {e}")
+
+    async def startup(self):
+        # Handle messages (received from control_receiver.py) as soon as they arrive, rather than polling the pipe
+        asyncio.get_event_loop().add_reader(self.pipe.fileno(), self.pipe_reader)
+        # Work out the static parts of the initial message before any clients connect
+        self.get_init_info()
+        # Uptime is sent in the initial message, so only read the boot time once
+        self.boot_time = psutil.boot_time()
+        # Let sensors that can detect changes themselves send them as soon as they happen. They may push from any
+        # thread, so hand the data over to the event loop
+        loop = asyncio.get_event_loop()
+        for sensor in self.sensors:
+            sensor.start_push(functools.partial(loop.call_soon_threadsafe, self.push_reading, sensor))
+        # Start writing telemetry (if enabled) on its own thread
+        self.recorder.start()
+        # Start the sampling task that produces messages for every client
+        asyncio.ensure_future(self.sample_loop())
+        # Periodically send sensor health to clients
+        if self.health.interval > 0:
+            asyncio.ensure_future(self.health_loop())
+        # Sensors are shared by all clients, so only close them when the process exits
+        atexit.register(self.close)
+
+    async def sample_loop(self):
         while True:
+            # Don't read any sensors while nobody is connected, unless we are keeping a history or recording
+            if not self.history.enabled and not self.recorder.enabled:
+                await self.hub.wait_for_clients()
+            # Anything going wrong is logged, rather than ending the loop and leaving every client without data
+            try:
+                # Start reading every sensor that is due. Their data is sent as each read finishes
+                self.start_reads()
+                next_due = self.scheduler.next_due()
+            except Exception:
+                self.logger.exception("Failed to read sensors")
+                next_due = None
+            # Sleep until the next sensor is due, or until a sensor is rescheduled to be read sooner
+            timeout = 1 if next_due is None else max(0, next_due - time.monotonic())
+            self.scheduler.wakeup.clear()
             try:
-                # Check if there are messages ready to be received
-                if self.pipe.poll():
-                    # Handle message (received from control_receiver.py)
-                    await self.pipe_message_handler(self.pipe.recv())
-                # Send sensor data etc
-                data = self.get_data()
-                # Make sure data is not empty
-                if data != "{}":
-                    await websocket.send(data)
-                # Short sleep to prevent issues
-                await asyncio.sleep(0.05)
-            except websockets.exceptions.ConnectionClosed:
-                self.logger.info(f"Client disconnected ({websocket.remote_address[0]})")
-                break
+                await asyncio.wait_for(self.scheduler.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def health_loop(self):
+        while True:
+            await asyncio.sleep(self.health.interval)
+            if self.hub.clients:
+                try:
+                    health = self.health.report()
+                    # Include how many messages each client has had merged because it couldn't keep up
+                    health["clients"] = self.hub.stats()
+                    self.hub.publish({"sensor_health": health})
+                except Exception:
+                    self.logger.exception("Failed to send sensor health")
+
+    def close(self):
         # Close each sensor
         for sensor in self.sensors:
             sensor.close()
+        self.engine.close()
+        self.recorder.close()
+        self.buses.close()
+        self.stats.close()
+
+    async def main(self, websocket, path):
+        self.logger.info(f"New client connected ({websocket.remote_address[0]})")
+        # Register client, so it receives messages from the sampling task
+        client = self.hub.register(websocket)
+        try:
+            # Send the initial info to notify interface that the service is ready.
+            await self.send_init_info(client)
+            # Send messages to this client, and handle its requests, until it disconnects
+            tasks = [asyncio.ensure_future(self.hub.serve(client)), asyncio.ensure_future(self.receive(client))]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            # Raise any exception (e.g. ConnectionClosed) from whichever task finished
+            for task in done:
+                task.result()
+        except websockets.exceptions.ConnectionClosed:
+            self.logger.info(f"Client disconnected ({websocket.remote_address[0]})")
+        finally:
+            self.hub.unregister(client)
@@ -1,11 +1,17 @@
 import logging
+from sensor_delta import DeltaEncoder
 
 
 class SensorWrapper:
+    # Shared I2C buses (a BusManager), set by SensorStream. Use self.buses.get(1) to get /dev/i2c-1
+    buses = None
+    # Shared host metrics (a SystemStats), set by SensorStream. Use these rather than calling psutil directly
+    stats = None
+
     def __init__(self, config):
         # Setup logger
         self.logger = logging.getLogger(__name__)
-        # Last time get_data() was called
+        # Last time get_data() was called (set by the SensorScheduler)
         self.last_run = 0
         # If any of these required values do not exist in the config, display a warning
         if {'enabled', 'type', 'period', 'name'} > set(config):
@@ -14,25 +20,54 @@ class SensorWrapper:
         self.enabled = config.get('enabled', False)
         self.period = config.get('period', -1)
         self.name = config.get('name', self.type_)
+        # How long get_data() is allowed to take before it is skipped, uses the stream default if not set
+        self.timeout = config.get('timeout', None)
+        # How much the value must change by before it is sent again, when delta encoding is enabled
+        self.deadband = float(config.get('deadband', 0))
+        # Optionally adapt the period to the sensor's activity: back off while the value is stable, and speed back up
+        # as soon as it starts changing
+        adaptive = config.get('adaptive', None)
+        self.adaptive = adaptive is not None
+        if self.adaptive:
+            self.min_period = float(adaptive.get('min_period', self.period))
+            self.max_period = float(adaptive.get('max_period', self.min_period * 10))
+            # How much the period grows by each time the value hasn't changed
+            self.backoff = float(adaptive.get('backoff', 2))
+            # How much the value must change by between reads to count as changing
+            self.threshold = float(adaptive.get('threshold', self.deadband))
+            self.period = self.min_period
+        # Previous value read, for adaptive periods
+        self.last_value = None
 
     def get_data(self):
         return None
 
+    def adapt(self, data):
+        """Update the period based on a new value from get_data(). Returns True if the period got shorter"""
+        if not self.adaptive:
+            return False
+        period = self.period
+        if self.last_value is not None and not DeltaEncoder.changed(self.last_value, data, self.threshold):
+            self.period = min(self.period * self.backoff, self.max_period)
+        else:
+            self.period = self.min_period
+        self.last_value = data
+        return self.period < period
+
     def get_initial(self):
         return None
 
-    def is_ready(self, now):
-        # Time since last checked
-        elapsed_time = now - self.last_run
-        # Only get data if it has been long enough since last run
-        # Or if this is the first time checking since we need some data on the graph
-        if elapsed_time > self.period or self.last_run == 0:
-            # Store current time as last_time 
-            self.last_run = now
-            # Only return True if sensor is actually enabled
-            return self.enabled
-        else:
-            return False
+    def start_push(self, push):
+        # Sensors that can tell when their value changes (e.g. using interrupts) can call push(data) from any
+        # thread to send new data straight away, rather than waiting to be read at the next period
+        pass
 
     def close(self):
         pass
+
+
+# Sensor wrappers for devices that can be read without blocking (e.g. with asyncio serial or network connections)
+# inherit this class instead. get_data() is awaited in the event loop rather than run in a worker thread
+class AsyncSensorWrapper(SensorWrapper):
+    async def get_data(self):
+        return None
@@ -1,5 +1,4 @@
 from sensor_wrapper import SensorWrapper
-import psutil
 
 
 class CPUUsageWrapper(SensorWrapper):
@@ -14,4 +13,4 @@ class CPUUsageWrapper(SensorWrapper):
         return {"limit": 100}
 
     def get_data(self):
-        return psutil.cpu_percent()
+        return self.stats.cpu_percent()
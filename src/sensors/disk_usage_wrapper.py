@@ -1,5 +1,4 @@
 from sensor_wrapper import SensorWrapper
-import psutil
 
 
 class DiskUsageWrapper(SensorWrapper):
@@ -14,8 +13,10 @@ class DiskUsageWrapper(SensorWrapper):
     def get_initial(self):
         # >> 20 will convert bytes to megabytes. Then we divide by 1024 to get GB but with decimals
         # Then round to 2 decimal places. This is the limit when displayed on the circle graph
-        return {"limit": round((psutil.disk_usage('/').total >> 20) / 1024, self.precision)}
+        total, used = self.stats.disk_usage('/')
+        return {"limit": round((total >> 20) / 1024, self.precision)}
 
     def get_data(self):
         # Get disk space in use
-        return round((psutil.disk_usage('/').used >> 20) / 1024, self.precision)
+        total, used = self.stats.disk_usage('/')
+        return round((used >> 20) / 1024, self.precision)
@@ -1,5 +1,4 @@
 from sensor_wrapper import SensorWrapper
-import psutil
 
 
 class MemoryWrapper(SensorWrapper):
@@ -11,8 +10,10 @@ class MemoryWrapper(SensorWrapper):
 
     def get_initial(self):
         # Get total memory, in MB, this is used on circle graphs to calculate percentage
-        return {"limit": psutil.virtual_memory().total >> 20}
+        total, used = self.stats.memory()
+        return {"limit": total >> 20}
 
     def get_data(self):
         # Get memory in use and add to msg, using bit shift operator to represent in MB
-        return psutil.virtual_memory().used >> 20
+        total, used = self.stats.memory()
+        return used >> 20
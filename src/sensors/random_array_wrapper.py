@@ -0,0 +1,39 @@
+from sensor_wrapper import SensorWrapper
+from array import array
+import math
+import random
+import time
+
+
+# Synthetic grid sensor, like an 8x8 thermal camera, for testing array sensors without any hardware. Random noise with
+# a warm spot that moves around the grid
+class RandomArrayWrapper(SensorWrapper):
+    # What type of sensor this wrapper handles
+    type_ = 'random_array'
+
+    def __init__(self, config):
+        SensorWrapper.__init__(self, config)
+        self.width = int(config.get('width', 8))
+        self.height = int(config.get('height', 8))
+        self.min = float(config.get('min', 20))
+        self.max = float(config.get('max', 30))
+
+    def get_initial(self):
+        # Array sensors describe the shape and element type of their data
+        return {"shape": [self.height, self.width], "dtype": "float32", "mintemp": self.min,
+                "maxtemp": self.max}
+
+    def get_data(self):
+        # Centre of the warm spot, circling the middle of the grid
+        t = time.monotonic()
+        cx = (1 + math.cos(t)) / 2 * (self.width - 1)
+        cy = (1 + math.sin(t)) / 2 * (self.height - 1)
+        spread = max(self.width, self.height) / 4
+        # A new array each time, since the sensor stream may still hold on to the last one
+        data = array('f')
+        for y in range(self.height):
+            for x in range(self.width):
+                warmth = math.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * spread ** 2))
+                noise = random.uniform(0, 0.1)
+                data.append(self.min + (self.max - self.min) * min(1, warmth * 0.9 + noise))
+        return data
@@ -0,0 +1,100 @@
+from sensor_wrapper import SensorWrapper
+from telemetry import TelemetryReader
+from array import array
+import bisect
+import threading
+import time
+
+
+# Recorded telemetry, loaded once and shared between every replay sensor that uses the same directory
+class Recording:
+    # Loaded recordings, by directory
+    cache = {}
+    lock = threading.Lock()
+
+    def __init__(self, directory):
+        # Times and values for each (uid, field) channel
+        self.channels = {}
+        self.start = None
+        self.end = None
+        for t, seq, uid, field, value in TelemetryReader(directory):
+            if (uid, field) not in self.channels:
+                self.channels[(uid, field)] = (array('d'), array('d'))
+            times, values = self.channels[(uid, field)]
+            times.append(t)
+            values.append(value)
+            if self.start is None:
+                self.start = t
+            self.end = t
+        # Fields of each recorded sensor uid (None for sensors with a single value)
+        self.sensors = {}
+        for uid, field in self.channels:
+            self.sensors.setdefault(uid, []).append(field)
+
+    @classmethod
+    def load(cls, directory):
+        # Sensors are read from multiple threads, so make sure a recording is only loaded once
+        with cls.lock:
+            if directory not in cls.cache:
+                cls.cache[directory] = cls(directory)
+            return cls.cache[directory]
+
+    @property
+    def duration(self):
+        return self.end - self.start if self.start is not None else 0
+
+    def value_at(self, uid, field, t):
+        # The last value recorded at or before time t
+        times, values = self.channels[(uid, field)]
+        i = bisect.bisect_right(times, t) - 1
+        return values[i] if i >= 0 else None
+
+
+class ReplayWrapper(SensorWrapper):
+    # What type of sensor this wrapper handles
+    type_ = 'replay'
+
+    def __init__(self, config):
+        SensorWrapper.__init__(self, config)
+        # Directory of recorded telemetry segments
+        self.directory = config.get('directory', 'telemetry')
+        # uid of the recorded sensor to play back. If not set, each replay sensor plays a different recorded sensor
+        self.source = config.get('source', None)
+        # Playback speed, e.g. 2 plays back at twice real time
+        self.speed = float(config.get('speed', 1))
+        # Where to start playing from, in seconds from the start of the recording
+        self.offset = float(config.get('offset', 0))
+        # Whether to start again from the beginning once the recording ends
+        self.loop = config.get('loop', True)
+        # A recording that can't be read just means this sensor has no data, rather than stopping the sensor stream
+        try:
+            self.recording = Recording.load(self.directory)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Could not load the recording in '{self.directory}': {e}")
+            self.recording = None
+        # Wall clock time playback started
+        self.started = None
+
+    def get_data(self):
+        if self.recording is None or not self.recording.sensors:
+            return None
+        if self.started is None:
+            self.started = time.monotonic()
+            if self.source is None:
+                # Spread replay sensors across the recorded sensors, using this sensor's index
+                sources = sorted(self.recording.sensors)
+                self.source = sources[(self.index - 1) % len(sources)]
+        if self.source not in self.recording.sensors:
+            self.logger.error(f"Sensor '{self.source}' was not found in the recording in '{self.directory}'")
+            return None
+        # Position in the recording
+        position = self.offset + (time.monotonic() - self.started) * self.speed
+        if position > self.recording.duration:
+            if not self.loop:
+                return None
+            position %= self.recording.duration or 1
+        t = self.recording.start + position
+        fields = self.recording.sensors[self.source]
+        if fields == [None]:
+            return self.recording.value_at(self.source, None, t)
+        return {field: self.recording.value_at(self.source, field, t) for field in fields}
@@ -1,4 +1,7 @@
 from sensor_wrapper import SensorWrapper
+from gpio_backend import load_gpio
+import threading
+import time
 
 
 class SwitchWrapper(SensorWrapper):
@@ -7,23 +10,64 @@ class SwitchWrapper(SensorWrapper):
 
     def __init__(self, config):
         SensorWrapper.__init__(self, config)
-
-        # Try importing the RPi GPIO module but don't throw an error if it fails, instead try to import the Jetson one
-        # If that fails too, let it throw an error
-        try:
-            import RPi.GPIO as GPIO
-        except ImportError:
-            import Jetson.GPIO as GPIO
-
+        # Either 'gpio' for the Raspberry Pi or Jetson GPIO pins, or 'fake' for testing without any
+        self.GPIO = load_gpio(config.get('backend', 'gpio'))
         # Get assigned pin that hall effect sensor is attached to
-        self.pin = config.get(int("pin"), 17)
+        self.pin = int(config.get('pin', 17))
+        # Either 'poll' to read the switch every period, or 'edge' to also send changes as soon as they happen
+        self.mode = config.get('mode', 'poll')
+        # Changes within this many seconds of the last one are treated as the switch bouncing
+        self.debounce = float(config.get('debounce', 0.02))
+        # Last state sent by an edge, and when it changed
+        self.state = None
+        self.last_change = 0
+        # Checks the state once the switch has stopped bouncing
+        self.settle_timer = None
+        self.lock = threading.Lock()
+        self.push = None
         # Setup GPIO
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        #GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=sensorCallback, bouncetime=200)
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setup(self.pin, self.GPIO.IN, pull_up_down=self.GPIO.PUD_UP)
+
+    def start_push(self, push):
+        if self.mode != 'edge':
+            return
+        self.push = push
+        self.state = self.GPIO.input(self.pin)
+        # Debouncing is done here rather than with bouncetime, so that the final state is never missed
+        self.GPIO.add_event_detect(self.pin, self.GPIO.BOTH, callback=self.on_edge)
+
+    def on_edge(self, channel):
+        # Called on the GPIO library's thread
+        with self.lock:
+            now = time.monotonic()
+            # Send the first edge straight away, unless the switch is still bouncing from the last change
+            if now - self.last_change >= self.debounce:
+                self.report(self.GPIO.input(self.pin), now)
+            # Check again once it has stopped bouncing, in case it settled in a different state
+            if self.settle_timer is not None:
+                self.settle_timer.cancel()
+            self.settle_timer = threading.Timer(self.debounce, self.settle)
+            self.settle_timer.daemon = True
+            self.settle_timer.start()
+
+    def settle(self):
+        with self.lock:
+            self.settle_timer = None
+            self.report(self.GPIO.input(self.pin), time.monotonic())
+
+    def report(self, state, now):
+        if state != self.state:
+            self.state = state
+            self.last_change = now
+            self.push(state)
 
     def get_data(self):
-        return GPIO.input(self.pin)
+        return self.GPIO.input(self.pin)
 
     def close(self):
-        GPIO.cleanup(self.pin)
+        if self.push is not None:
+            self.GPIO.remove_event_detect(self.pin)
+        if self.settle_timer is not None:
+            self.settle_timer.cancel()
+        self.GPIO.cleanup(self.pin)
@@ -8,7 +8,8 @@ from multiprocessing import Pipe
 import multiprocessing
 from websocket_process import WebSocketProcess
 import asyncio as aio
-from plugin_system import PluginManager
+from concurrent.futures import ThreadPoolExecutor
+from plugin_system import PluginManager, call_plugin, call_plugin_now
 from servo_wrapper import ServoWrapper, ServoModel
 from servos.virtual import VirtualConnection
 from typing import List, Optional
@@ -55,6 +56,9 @@ class ServoHandler:
             Servos[int(servo)] = self.connection.create_servo_model(int(servo), conf, part)
         self.logger.info(f"Debug message 5")
         self.Servos = Servos
+        # Sync servo connections are run in their own thread, so that waiting for a servo to reach its position
+        # doesn't block the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servos")
 
     def get_initial_messages(self):
         msg = []
@@ -63,28 +67,62 @@ class ServoHandler:
         return {"SERVO_POS": msg}
 
     
-    def go_to_pos(self, channel, pos):
+    async def go_to_pos(self, channel, pos):
         self.Servos[channel].pos = pos
-        self.connection.go_to(channel, pos)
+        await call_plugin(self.connection.go_to, self.executor, channel, pos)
         if self.Servos[channel].part is not None:
             self.logger.debug("Sending updated servo pos of {}".format(self.Servos[channel].part))
             self.pipe.send(["SERVO_POS", self.Servos[channel].part, pos])
 
-    def go_to_pos_async(self, channel, pos):
+    async def go_to_pos_async(self, channel, pos):
         self.Servos[channel].pos = pos
-        self.connection.go_to_async(channel, pos)
+        # Connections that can set a target without waiting for the servo to get there provide go_to_async()
+        go_to = getattr(self.connection, 'go_to_async', self.connection.go_to)
+        await call_plugin(go_to, self.executor, channel, pos)
         if self.Servos[channel].part is not None:
             self.pipe.send(["SERVO_POS", self.Servos[channel].part, pos])
     
+    async def go_to_many_async(self, targets):
+        """Start moving several servos at once, given a dict of channel: position, without waiting for them to get
+        there"""
+        for channel, pos in targets.items():
+            self.Servos[channel].pos = pos
+        go_to_multi = getattr(self.connection, 'go_to_multi', None)
+        if go_to_multi is not None:
+            await call_plugin(go_to_multi, self.executor, targets)
+        else:
+            go_to = getattr(self.connection, 'go_to_async', self.connection.go_to)
+            for channel, pos in targets.items():
+                await call_plugin(go_to, self.executor, channel, pos)
+        for channel, pos in targets.items():
+            if self.Servos[channel].part is not None:
+                self.pipe.send(["SERVO_POS", self.Servos[channel].part, pos])
+
+    async def wait_for_pos(self, channel, pos, timeout=5, interval=0.02):
+        """Wait until a servo reaches `pos`, checking every `interval` seconds. Returns False if it hasn't got there
+        within `timeout` seconds. Unlike go_to(), this can be cancelled at any point"""
+        loop = aio.get_event_loop()
+        end = loop.time() + timeout
+        while True:
+            current = await call_plugin(self.connection.get_pos, self.executor, channel)
+            # Connections that can't read positions back are assumed to get there straight away
+            if current is None or current == pos:
+                return True
+            if loop.time() >= end:
+                return False
+            await aio.sleep(interval)
+
     def move(self, channel, speed):
         pass
     
-    def stop(self):
-        self.connection.stop()
+    async def stop(self):
+        await call_plugin(self.connection.stop, self.executor)
 
 
     def close(self):
         self.logger.info("Closing servo connection")
         # Set all servos to 0 and close connection
-        self.stop()
+        call_plugin_now(self.connection.stop)
         self.connection.close()
+        self.executor.shutdown(wait=False)
+
@@ -19,8 +19,25 @@ class ServoWrapper:
     def go_to(self, channel, pos):
         pass
 
+    def get_pos(self, channel):
+        # Current position of a servo, or None if the connection can't read it back
+        return None
+
     def stop(self, channel=None):
         pass
 
     def close(self):
         pass
+
+
+# Servo handlers that communicate without blocking (e.g. with asyncio serial or network connections) inherit this
+# class instead. Its methods are awaited in the event loop, rather than run in a worker thread
+class AsyncServoWrapper(ServoWrapper):
+    async def go_to(self, channel, pos):
+        pass
+
+    async def get_pos(self, channel):
+        return None
+
+    async def stop(self, channel=None):
+        pass
@@ -12,6 +12,8 @@ class MaestroConnection(ServoWrapper):
         ServoWrapper.__init__(self, config)
         self.address = config.get('address', 12)
         self.port = config.get('port', "/dev/ttyACM0")
+        # Whether to move several servos with a single command. The Micro Maestro doesn't support this
+        self.multi_target = config.get('multi_target', True)
         self.logger.info(f"Connected to maestro at {self.port}")
         self.Controller = mae.Controller(port=self.port, device=self.address)
         self.Controller.getErrors()
@@ -58,6 +60,23 @@ class MaestroConnection(ServoWrapper):
         self.logger.info(f"Trying to moving channel {channel} to position {pos}")
         self.Controller.setTarget(channel, pos)
 
+    def go_to_multi(self, targets):
+        # Set targets for several channels at once, without waiting for the servos to get there. The multi-target
+        # command sets consecutive channels, so send one for each run of consecutive channels
+        channels = sorted(targets)
+        i = 0
+        while i < len(channels):
+            j = i + 1
+            while self.multi_target and j < len(channels) and channels[j] == channels[j - 1] + 1:
+                j += 1
+            if j - i > 1:
+                self.Controller.setTargetMulti(channels[i], [targets[channel] for channel in channels[i:j]])
+            else:
+                self.Controller.setTarget(channels[i], targets[channels[i]])
+            i = j
+
+    def get_pos(self, channel):
+        return self.Controller.getPosition(channel)
 
     def stop(self):
         pass
@@ -96,32 +96,26 @@ class Controller:
         self.Targets[chan] = target
         return target
 
-    def setTargetMulti(self, chan1, chans, target):
-        # if Min is defined and Target is below, force to Min
-        minV=-1000000000000000000000000000000000000
-        maxV=1000000000000000000000000000000000000
-        for chan in range(chan1, chan1+chans+1):
+    # Set the targets of several channels in a single command, so that they all start
+    # moving at the same time. targets is a list of targets for consecutive channels,
+    # starting at chan1. Each target is constrained to its channel's Min and Max range.
+    # Not available with Micro Maestro.
+    def setTargetMulti(self, chan1, targets):
+        cmd = chr(0x1F) + chr(len(targets)) + chr(chan1)
+        for chan, target in enumerate(targets, chan1):
+            # if Min is defined and Target is below, force to Min
             if self.Mins[chan] > 0 and target < self.Mins[chan]:
-                minV = max(minV, self.Mins[chan])
+                target = self.Mins[chan]
             # if Max is defined and Target is above, force to Max
             if self.Maxs[chan] > 0 and target > self.Maxs[chan]:
-                maxV = min(maxV, self.Maxs[chan])
-        if minV > maxV:
-            return
-        if target < minV:
-            target = minV
-        if target < maxV:
-            target = maxV
-        #
-        lsb = target & 0x7f #7 bits for least significant byte
-        msb = (target >> 7) & 0x7f #shift 7 and take next 7 bits for msb
-        cmd = chr(0x1F) + chr(chans) + chr(chan1) + (chr(lsb) + chr(msb))*chans
-        self.sendCmd(cmd)
-        # Record Target value
-        for chan in range(chan1, chan1 + chans + 1):
+                target = self.Maxs[chan]
+            lsb = target & 0x7f #7 bits for least significant byte
+            msb = (target >> 7) & 0x7f #shift 7 and take next 7 bits for msb
+            cmd += chr(lsb) + chr(msb)
+            # Record Target value
             self.Targets[chan] = target
+        self.sendCmd(cmd)
 
-        
     # Set speed of channel
     # Speed is measured as 0.25microseconds/10milliseconds
     # For the standard 1ms pulse width change to move a servo between extremes, a speed
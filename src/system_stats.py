@@ -0,0 +1,147 @@
+import glob
+import logging
+import os
+import threading
+import time
+import psutil
+
+
+# Collects host metrics (CPU usage and temperature, memory and disk usage) for the system sensors. Each metric is read
+# at most once per `ttl` seconds no matter how many sensors use it, and the /proc and /sys files are kept open and
+# read with pread() rather than being reopened every time. Falls back to psutil where those files don't exist
+class SystemStats:
+    # Maximum number of bytes read from each file
+    READ_SIZE = 16384
+    # Temperature sensors used for the CPU temperature, in order of preference. Intel and AMD (coretemp), Nvidia
+    # Jetson (thermal-fan-est) and Raspberry Pi (cpu-thermal / cpu_thermal)
+    CPU_TEMP_SENSORS = ['coretemp', 'thermal-fan-est', 'cpu-thermal', 'cpu_thermal']
+
+    def __init__(self, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        # How long (in seconds) a reading is reused for
+        self.ttl = float(config.get('stats_ttl', 0.1))
+        # Sensors are read from multiple threads, so only one thread refreshes a metric at a time
+        self.lock = threading.Lock()
+        # Latest value of each metric, and when it was read
+        self.cache = {}
+        # Open file descriptors, by path
+        self.files = {}
+        # CPU time counters from the previous read of /proc/stat, used to work out usage since then
+        self.cpu_times = None
+        # Temperature input files for each sensor name, found the first time the temperature is read
+        self.temp_inputs = None
+
+    def get(self, key, read):
+        with self.lock:
+            now = time.monotonic()
+            if key not in self.cache or now - self.cache[key][0] >= self.ttl:
+                self.cache[key] = (now, read())
+            return self.cache[key][1]
+
+    def read_file(self, path):
+        # Read a whole file from the start, keeping it open for next time. Returns None if it can't be read
+        fd = self.files.get(path)
+        if fd is None:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                return None
+            self.files[path] = fd
+        try:
+            return os.pread(fd, self.READ_SIZE, 0).decode('ascii', 'replace')
+        except OSError:
+            return None
+
+    def cpu_percent(self):
+        """CPU usage (%) across all cores since the last time it was read"""
+        return self.get('cpu', self.read_cpu_percent)
+
+    def read_cpu_percent(self):
+        stat = self.read_file('/proc/stat')
+        if stat is None:
+            return psutil.cpu_percent()
+        # First line is the total time spent in each state: user nice system idle iowait irq softirq steal guest...
+        times = [int(value) for value in stat.split('\n', 1)[0].split()[1:]]
+        # Guest time is already included in user and nice
+        total = sum(times[:8])
+        idle = times[3] + times[4]
+        previous, self.cpu_times = self.cpu_times, (total, idle)
+        if previous is None or total == previous[0]:
+            return 0.0
+        return round(100 * (1 - (idle - previous[1]) / (total - previous[0])), 1)
+
+    def memory(self):
+        """(total, used) memory in bytes"""
+        return self.get('memory', self.read_memory)
+
+    def read_memory(self):
+        meminfo = self.read_file('/proc/meminfo')
+        if meminfo is None:
+            memory = psutil.virtual_memory()
+            return memory.total, memory.used
+        values = {}
+        for line in meminfo.splitlines():
+            name, _, value = line.partition(':')
+            values[name] = int(value.split()[0]) * 1024
+        total = values['MemTotal']
+        # Same as psutil, memory in use is anything that isn't available
+        available = values.get('MemAvailable', values.get('MemFree', 0))
+        return total, total - available
+
+    def disk_usage(self, path='/'):
+        """(total, used) space in bytes on the disk containing `path`"""
+        return self.get(('disk', path), lambda: self.read_disk_usage(path))
+
+    @staticmethod
+    def read_disk_usage(path):
+        # Same as psutil.disk_usage()
+        st = os.statvfs(path)
+        return st.f_blocks * st.f_frsize, (st.f_blocks - st.f_bfree) * st.f_frsize
+
+    def cpu_temp(self):
+        """Highest CPU temperature (°C), or None if no supported temperature sensor was found"""
+        return self.get('cpu_temp', self.read_cpu_temp)
+
+    def find_temp_inputs(self):
+        # Find the temperature inputs of each named sensor once, instead of walking every hwmon device on every read
+        inputs = {}
+        for directory in sorted(glob.glob('/sys/class/hwmon/hwmon*')):
+            name = self.read_file(os.path.join(directory, 'name'))
+            if name is not None:
+                inputs.setdefault(name.strip(), []).extend(sorted(glob.glob(os.path.join(directory, 'temp*_input'))))
+        # Thermal zones, for systems whose sensors don't show up in hwmon
+        for directory in sorted(glob.glob('/sys/class/thermal/thermal_zone*')):
+            name = self.read_file(os.path.join(directory, 'type'))
+            if name is not None:
+                inputs.setdefault(name.strip(), []).append(os.path.join(directory, 'temp'))
+        return inputs
+
+    def read_cpu_temp(self):
+        if self.temp_inputs is None:
+            self.temp_inputs = self.find_temp_inputs()
+            if not self.temp_inputs and hasattr(psutil, 'sensors_temperatures'):
+                self.logger.debug("No temperature sensors found in /sys, using psutil")
+        for name in self.CPU_TEMP_SENSORS:
+            if name in self.temp_inputs:
+                temps = []
+                for path in self.temp_inputs[name]:
+                    value = self.read_file(path)
+                    if value is not None and value.strip():
+                        # Reported in millidegrees
+                        temps.append(int(value) / 1000)
+                # coretemp reports each core separately, so use the hottest
+                if temps:
+                    return round(max(temps), 1)
+        if not self.temp_inputs and hasattr(psutil, 'sensors_temperatures'):
+            temp_data = psutil.sensors_temperatures()
+            for name in self.CPU_TEMP_SENSORS:
+                if name in temp_data:
+                    return round(max(sensor.current for sensor in temp_data[name]), 1)
+        return None
+
+    def close(self):
+        with self.lock:
+            for fd in self.files.values():
+                os.close(fd)
+            self.files = {}
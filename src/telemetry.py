@@ -0,0 +1,264 @@
+import bisect
+import json
+import logging
+import mmap
+import numbers
+import os
+import queue
+import struct
+import threading
+import time
+
+
+# Telemetry is recorded to a directory of segment files. Each segment file is laid out as (little-endian):
+#
+#   magic (8 bytes), header length (u32), header (utf-8 JSON), padding to a multiple of 8 bytes
+#   records: time (f64), value (f64), sequence number (u32), channel (u16), padding (2 bytes)
+#
+# Every record is the same size, so a segment can be memory-mapped and searched by time without reading it all. The
+# header lists the channels in the segment, where a channel is a sensor uid and, for multi-sensors, a field name. The
+# header length includes spare space after the JSON (filled with spaces), so channels that first appear part way
+# through a segment can be added to the header in place, before any of their records are written.
+MAGIC = b"SIGHTSTM"
+HEADER_LENGTH = struct.Struct("<I")
+RECORD = struct.Struct("<ddIH2x")
+EXTENSION = ".stm"
+# Smallest amount of space reserved for each segment's header
+HEADER_SPACE = 4096
+
+
+def data_offset(header_length):
+    # Records start at the first multiple of 8 bytes after the header
+    offset = len(MAGIC) + HEADER_LENGTH.size + header_length
+    return (offset + 7) // 8 * 8
+
+
+# Writes every sensor reading to segment files on a background thread, so that disk writes never block the event loop
+class TelemetryRecorder:
+    def __init__(self, config):
+        # Setup logger
+        self.logger = logging.getLogger(__name__)
+        self.enabled = config.get('enabled', False)
+        # Directory that segment files are written to
+        self.directory = config.get('directory', 'telemetry')
+        # Start a new segment once the current one reaches either of these limits
+        self.max_segment_bytes = int(config.get('max_segment_bytes', 64 * 1024 * 1024))
+        self.max_segment_seconds = float(config.get('max_segment_seconds', 3600))
+        # Readings waiting to be written. If the disk can't keep up, readings are dropped rather than waiting
+        self.queue = queue.Queue(maxsize=int(config.get('queue', 1024)))
+        self.dropped = 0
+        # Current segment file, and when it was opened
+        self.file = None
+        self.segment_size = 0
+        self.segment_start = 0
+        # Space reserved for the current segment's header
+        self.header_space = 0
+        # Index of each (uid, field) channel in the current segment
+        self.channels = {}
+        self.thread = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Recording telemetry to '{self.directory}'")
+
+    def record(self, t, seq, readings):
+        """Queue a list of (uid, data) readings, all taken at time t, to be written"""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put_nowait((t, seq, readings))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                self.logger.warning(f"Telemetry recorder can't keep up, {self.dropped} sets of readings dropped")
+
+    def close(self):
+        if self.thread is None:
+            return
+        # Finish writing anything that is waiting, then stop
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    @staticmethod
+    def values(uid, data):
+        # Split a reading into (channel, value) pairs. Only numbers can be recorded
+        if isinstance(data, dict):
+            for field, value in data.items():
+                if isinstance(value, numbers.Real):
+                    yield (uid, str(field)), value
+        elif isinstance(data, numbers.Real):
+            yield (uid, None), data
+
+    def header(self):
+        return json.dumps({"version": 1, "created": self.segment_start, "channels": list(self.channels)}).encode('utf-8')
+
+    def open_segment(self, t, seq):
+        self.close_segment()
+        self.segment_start = t
+        # Include the sequence number, so segments opened within the same millisecond still get their own file. Opening
+        # with 'x' makes sure an existing segment is never overwritten
+        name = (time.strftime("%Y%m%d-%H%M%S", time.localtime(t)) + f"-{int(t * 1000) % 1000:03d}"
+                + f"-{seq & 0xFFFFFFFF:010d}" + EXTENSION)
+        path = os.path.join(self.directory, name)
+        header = self.header()
+        # Leave room for the header to grow as new channels appear
+        self.header_space = max(HEADER_SPACE, 2 * len(header))
+        offset = data_offset(self.header_space)
+        self.file = open(path, 'xb')
+        self.file.write(MAGIC + HEADER_LENGTH.pack(self.header_space) + header.ljust(self.header_space))
+        self.file.write(b"\0" * (offset - self.file.tell()))
+        self.segment_size = offset
+        self.logger.debug(f"Opened telemetry segment '{path}'")
+
+    def update_header(self):
+        # Rewrite the header of the current segment with the new channels. Returns False if there isn't enough space
+        header = self.header()
+        if len(header) > self.header_space:
+            return False
+        self.file.seek(len(MAGIC) + HEADER_LENGTH.size)
+        self.file.write(header.ljust(self.header_space))
+        self.file.seek(0, os.SEEK_END)
+        return True
+
+    def close_segment(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def write(self, t, seq, readings):
+        records = []
+        new_channel = False
+        for uid, data in readings:
+            for channel, value in self.values(uid, data):
+                if channel not in self.channels:
+                    self.channels[channel] = len(self.channels)
+                    new_channel = True
+                records.append((channel, value))
+        if not records:
+            return
+        # Rotate based on the size and age of the current segment. Segments list their channels in the header, so new
+        # channels are added to it, and only need a new segment if the header has run out of space
+        if (self.file is None or self.segment_size >= self.max_segment_bytes
+                or t - self.segment_start >= self.max_segment_seconds
+                or (new_channel and not self.update_header())):
+            self.open_segment(t, seq)
+        data = b"".join(RECORD.pack(t, value, seq & 0xFFFFFFFF, self.channels[channel]) for channel, value in records)
+        self.file.write(data)
+        # Flush straight away so that readers (and a crash) see every record that has been written
+        self.file.flush()
+        self.segment_size += len(data)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            # Log anything that goes wrong, rather than ending the thread and losing every reading after it
+            try:
+                self.write(*item)
+            except Exception:
+                self.logger.exception("Could not write telemetry")
+        self.close_segment()
+
+
+# A single segment file, memory-mapped for reading
+class TelemetrySegment:
+    # Number of records read from the map at a time
+    CHUNK = 4096
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a telemetry segment")
+        header_length, = HEADER_LENGTH.unpack_from(self.mmap, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        self.header = json.loads(self.mmap[start:start + header_length].decode('utf-8'))
+        # (uid, field) for each channel index
+        self.channels = [tuple(channel) for channel in self.header["channels"]]
+        self.offset = data_offset(header_length)
+        # A segment that is still being written may end part way through a record
+        self.count = (len(self.mmap) - self.offset) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def time(self, i):
+        return RECORD.unpack_from(self.mmap, self.offset + i * RECORD.size)[0]
+
+    @property
+    def start_time(self):
+        return self.time(0) if self.count else None
+
+    @property
+    def end_time(self):
+        return self.time(self.count - 1) if self.count else None
+
+    def index(self, t):
+        # Index of the first record at or after time t. Records are written in time order
+        return bisect.bisect_left(TimeIndex(self), t)
+
+    def __iter__(self):
+        return self.slice()
+
+    def slice(self, start=None, end=None):
+        """Iterate over (time, seq, uid, field, value) for every record where start <= time < end"""
+        first = 0 if start is None else self.index(start)
+        last = self.count if end is None else self.index(end)
+        # Read in chunks, so only a small part of the segment is copied out of the map at any one time
+        for chunk in range(first, last, self.CHUNK):
+            begin = self.offset + chunk * RECORD.size
+            data = self.mmap[begin:begin + min(self.CHUNK, last - chunk) * RECORD.size]
+            for t, value, seq, channel in RECORD.iter_unpack(data):
+                uid, field = self.channels[channel]
+                yield t, seq, uid, field, value
+
+    def close(self):
+        self.mmap.close()
+
+
+# Lets bisect search a segment by time without unpacking every record
+class TimeIndex:
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return len(self.segment)
+
+    def __getitem__(self, i):
+        return self.segment.time(i)
+
+
+# Reads a directory of recorded segments as one continuous recording
+class TelemetryReader:
+    def __init__(self, directory):
+        self.directory = directory
+        # Segment names start with the time they were created, so sorting them by name puts them in order
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(EXTENSION))
+
+    def segments(self):
+        for path in self.paths:
+            segment = TelemetrySegment(path)
+            try:
+                yield segment
+            finally:
+                segment.close()
+
+    def __iter__(self):
+        return self.slice()
+
+    def slice(self, start=None, end=None):
+        """Iterate over (time, seq, uid, field, value) for every record where start <= time < end"""
+        for segment in self.segments():
+            if not len(segment):
+                continue
+            # Skip segments that are entirely outside the time range
+            if (start is not None and segment.end_time < start) or (end is not None and segment.start_time >= end):
+                continue
+            yield from segment.slice(start, end)
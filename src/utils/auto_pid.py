@@ -3,6 +3,7 @@ from pyax12.connection import Connection
 from serial import Serial
 from enum import IntEnum
 from motor_handler import MotorHandler
+from plugin_system import call_plugin_now
 import json
 import time
 import atexit
@@ -74,11 +75,11 @@ def main():
                 right = int(msg["distance"][Distance.RIGHT])
 
             if (not reverse and front < 100):
-                motors.move(0, 0)
+                call_plugin_now(motors.move, 0, 0)
                 reverse = True
                 print("Reverse is true")
             elif (reverse and front < 100):
-                motors.move(0, 0)
+                call_plugin_now(motors.move, 0, 0)
                 reverse = False
                 print("Reverse is false")
             else:
@@ -109,9 +110,9 @@ def main():
 
                 # Move servos
                 if reverse:
-                    motors.move(-speed - pid, -speed + pid)
+                    call_plugin_now(motors.move, -speed - pid, -speed + pid)
                 else:
-                    motors.move(speed - pid, speed + pid)
+                    call_plugin_now(motors.move, speed - pid, speed + pid)
                 print(pid)
 
                 # Update last_error to the current error
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Measures how long stop messages take to reach the motors while the control receiver is flooded with gamepad
+input, and fails if any takes longer than the given bound. Uses virtual connections in place of the ones in the given
+config, with each motor write slowed down to simulate a serial link. Run from the root of the repository """
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from control_receiver import ControlReceiver
+from multiprocessing import Pipe
+from argparse import ArgumentParser
+import statistics
+import tempfile
+import websockets
+import asyncio
+import json
+import time
+
+# Setup argument parser
+parser = ArgumentParser()
+parser.add_argument("-c", "--config",
+                    dest="config",
+                    help="config file to load the connections from",
+                    metavar="<config>",
+                    default="configs/servo_config.json")
+parser.add_argument("-n", "--stops",
+                    dest="stops",
+                    help="number of stop messages to send",
+                    metavar="<stops>",
+                    type=int,
+                    default=50)
+parser.add_argument("-r", "--rate",
+                    dest="rate",
+                    help="number of gamepad messages to send per second, far more than a real gamepad sends",
+                    metavar="<rate>",
+                    type=int,
+                    default=2000)
+parser.add_argument("-w", "--write-time",
+                    dest="write_time",
+                    help="time (in ms) each motor write takes",
+                    metavar="<ms>",
+                    type=float,
+                    default=5)
+parser.add_argument("-b", "--bound",
+                    dest="bound",
+                    help="longest time (in ms) a stop is allowed to take",
+                    metavar="<ms>",
+                    type=float,
+                    default=50)
+parser.add_argument("-e", "--emergency",
+                    dest="emergency",
+                    help="send EMERGENCY_STOP instead of STOP",
+                    action="store_true")
+parser.add_argument("-p", "--port",
+                    dest="port",
+                    help="port to run the control receiver on",
+                    metavar="<port>",
+                    type=int,
+                    default=5565)
+args = parser.parse_args()
+
+# Use virtual connections, so that no hardware is moved
+config = json.load(open(args.config))
+for section in ['motors', 'paddles', 'servos']:
+    config[section]['type'] = 'virtual'
+config_file = tempfile.NamedTemporaryFile('w', suffix='.json')
+json.dump(config, config_file)
+config_file.flush()
+
+receiver = ControlReceiver(0, Pipe()[1], config_file.name)
+motors = receiver.motors
+
+# When each stop reached the motor connection
+stopped = []
+
+
+def slow_move_raw(left=None, right=None):
+    # Pretend to write to a serial port
+    time.sleep(args.write_time / 1000)
+
+
+def record_stop():
+    stopped.append(time.perf_counter())
+
+
+motors.connection.move_raw = slow_move_raw
+motors.connection.stop = record_stop
+
+
+async def flood(websocket, running):
+    # Send gamepad input at the given rate, in batches every 10ms, with the odd keyboard message mixed in
+    i = 0
+    next_batch = time.perf_counter()
+    while running.is_set():
+        for _ in range(max(1, args.rate // 100)):
+            i += 1
+            await websocket.send(json.dumps({"type": "AXIS", "control": "LEFT_STICK_Y",
+                                             "value": (i % 200 - 100) / 100}))
+            if i % 50 == 0:
+                await websocket.send(json.dumps({"type": "KEYBOARD", "control": "FORWARD", "value": "DOWN"}))
+        next_batch += 0.01
+        await asyncio.sleep(max(0, next_batch - time.perf_counter()))
+
+
+async def benchmark():
+    await receiver.startup()
+    server = await websockets.serve(receiver.main, "127.0.0.1", args.port)
+    latencies = []
+    control = "EMERGENCY_STOP" if args.emergency else "STOP"
+    async with websockets.connect(f"ws://127.0.0.1:{args.port}") as websocket:
+        running = asyncio.Event()
+        running.set()
+        flooder = asyncio.ensure_future(flood(websocket, running))
+        for _ in range(args.stops):
+            # Let a backlog of input build up before each stop
+            await asyncio.sleep(0.05)
+            count = len(stopped)
+            sent = time.perf_counter()
+            await websocket.send(json.dumps({"type": "KEYBOARD", "control": control}))
+            while len(stopped) == count:
+                await asyncio.sleep(0.0005)
+            latencies.append((stopped[count] - sent) * 1000)
+        running.clear()
+        await flooder
+    server.close()
+    return latencies
+
+
+latencies = asyncio.get_event_loop().run_until_complete(benchmark())
+latencies.sort()
+print(f"{len(latencies)} stops with {args.rate} gamepad messages/s and {args.write_time}ms motor writes")
+print(f"min {latencies[0]:.2f}ms, median {statistics.median(latencies):.2f}ms, "
+      f"p99 {latencies[int(len(latencies) * 0.99)]:.2f}ms, max {latencies[-1]:.2f}ms")
+assert latencies[-1] <= args.bound, f"Slowest stop took {latencies[-1]:.2f}ms, more than {args.bound}ms"
+print(f"All stops took less than {args.bound}ms")
+motors.close()
+motors.close_paddle()
+receiver.servos.close()
@@ -26,13 +26,22 @@ class WebSocketProcess(multiprocessing.Process):
             self.ip = self.config['network']['ip']
         else:
             self.ip = '*'
+        # WebSocket subprotocols the server can negotiate, if any
+        self.subprotocols = None
         # Get nice name (e.g. "SensorStream")
         self.name = self.__class__.__name__
 
     def run(self):
         self.logger.info("Starting " + self.name + " process at " + self.ip + ":" + str(self.port))
+        loop = asyncio.get_event_loop()
+        # Start any background tasks before clients can connect
+        loop.run_until_complete(self.startup())
         # Start the WebSocket server, run the main() function
-        start_server = websockets.serve(self.main, self.ip, self.port)
-        asyncio.get_event_loop().run_until_complete(start_server)
-        asyncio.get_event_loop().run_forever()
+        start_server = websockets.serve(self.main, self.ip, self.port, subprotocols=self.subprotocols)
+        loop.run_until_complete(start_server)
+        loop.run_forever()
         self.logger.info("Exiting " + self.name + " process")
+
+    async def startup(self):
+        # Called in the new process, before the WebSocket server starts
+        pass